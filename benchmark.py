@@ -0,0 +1,167 @@
+"""
+端到端基准测试: 用合成的价格面板离线运行 main.py 的各个阶段, 记录耗时、内存峰值和输出大小
+
+    python benchmark.py                              # 默认规模, 与 bench_baseline.json 比较
+    python benchmark.py --sizes 50x750 2000x5000     # 标的数 x 交易日数
+    python benchmark.py --update-baseline            # 把本次结果保存为基线
+
+bench_baseline.json 随仓库提交, 是默认规模在开发机上的结果。改动计算逻辑的提交在合并前跑一次:
+某个阶段的耗时或内存峰值超出 TOLERANCE 时列出退化项并以退出码 1 结束, 可直接用作 CI 或 git hook 的检查。
+耗时和机器有关, 换机器后先在改动前的代码上 --update-baseline 再比较。
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import main
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_SIZES = ["11x750", "100x2500", "500x5000"]
+# 超过基线多少算退化; 耗时差小于 min_seconds 的视为噪声
+TOLERANCE = {'wall': 0.5, 'peak_mb': 0.25, 'min_seconds': 0.01}
+# 比值扫描取前 SCAN_SECTORS 个板块两两组合 (30 个即 435 对)
+SCAN_SECTORS = 30
+# configure() 会改写 main 的配置, 先记下原始的 Ticker 和指标
+BASE_TICKERS = sorted(main.collect_real_tickers())
+BASE_INDICATORS = list(main.INDICATORS)
+
+
+def make_price_panel(n_tickers, n_days, seed=0):
+    """生成几何布朗运动价格面板, 包含基准、合成指数成分和指标用到的 Ticker"""
+    rng = np.random.default_rng(seed)
+    names = BASE_TICKERS + [f"S{i:04d}" for i in range(n_tickers)]
+    index = pd.bdate_range(end="2025-12-31", periods=n_days)
+    log_ret = rng.normal(0.0003, 0.012, size=(n_days, len(names)))
+    return pd.DataFrame(100 * np.exp(np.cumsum(log_ret, axis=0)), index=index, columns=names), names[len(BASE_TICKERS):]
+
+
+def configure(panel, sectors, n_indicators):
+    """把 main 的配置切换为合成面板的板块和指标, 数据源改为内存"""
+    main.SECTOR_CONFIG = {'BENCHMARK': 'SPY', 'SECTORS': {t: f"⚔️ {t}" for t in sectors}}
+    pairs = [{'name': f"{a}/{b}", 'numerator': a, 'denominator': b, 'description': ''}
+             for a, b in zip(sectors[:n_indicators], sectors[1:n_indicators + 1])]
+    main.INDICATORS = BASE_INDICATORS + pairs
+    main.DATA_SOURCE['provider'] = 'memory'
+    main.CACHE_CONFIG['enabled'] = False
+    main.RESULT_CACHE['enabled'] = False
+    main.set_memory_prices(panel)
+
+
+def measure(fn, repeat):
+    """返回 (结果, 最短耗时, 内存峰值 MB); 内存单独跑一次, 避免 tracemalloc 拖慢计时"""
+    times = []
+    for _ in range(repeat):
+        # 表达式缓存会让第二次起直接命中, 每次计时前清空
+        main._SERIES_MEMO.clear()
+        gc.collect()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        times.append(time.perf_counter() - t0)
+    main._SERIES_MEMO.clear()
+    gc.collect()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(times), peak / 1024 / 1024
+
+
+def run_size(size, n_indicators, repeat):
+    n_tickers, n_days = (int(v) for v in size.split('x'))
+    panel, sectors = make_price_panel(n_tickers, n_days)
+    configure(panel, sectors, n_indicators)
+    html_path = os.path.join(tempfile.mkdtemp(), "index.html")
+
+    results = {}
+    df, wall, peak = measure(lambda: main.get_data_and_synthesize('max'), repeat)
+    results['get_data_and_synthesize'] = {'wall': wall, 'peak_mb': peak, 'rows': len(df), 'columns': df.shape[1]}
+
+    rrg, wall, peak = measure(lambda: main.calculate_rrg_components(df), repeat)
+    results['calculate_rrg_components'] = {'wall': wall, 'peak_mb': peak, 'series': len(rrg)}
+
+    ind, wall, peak = measure(lambda: main.calculate_indicators(main.INDICATORS, df), repeat)
+    results['calculate_indicators'] = {'wall': wall, 'peak_mb': peak, 'series': len(ind)}
+
+    pairs = [(a, b) for i, a in enumerate(sectors[:SCAN_SECTORS]) for b in sectors[i + 1:SCAN_SECTORS]]
+    ranking, wall, peak = measure(lambda: main.rank_ratio_pairs(df, pairs), repeat)
+    results['rank_ratio_pairs'] = {'wall': wall, 'peak_mb': peak, 'series': len(ranking)}
+
+    _, wall, peak = measure(lambda: main.generate_dashboard(rrg, ind, html_path), repeat)
+    results['generate_dashboard'] = {'wall': wall, 'peak_mb': peak, 'output_bytes': os.path.getsize(html_path)}
+
+    text, wall, peak = measure(lambda: main.build_telegram_message(rrg, ind), repeat)
+    results['send_telegram'] = {'wall': wall, 'peak_mb': peak, 'output_bytes': len(text.encode('utf-8'))}
+    return results
+
+
+def compare(report, baseline):
+    """和基线比较, 返回退化项列表"""
+    regressions = []
+    for size, stages in report.items():
+        for stage, cur in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if not base:
+                continue
+            if cur['wall'] > base['wall'] * (1 + TOLERANCE['wall']) and cur['wall'] - base['wall'] > TOLERANCE['min_seconds']:
+                regressions.append(f"{size} {stage}: 耗时 {base['wall']:.3f}s -> {cur['wall']:.3f}s")
+            if cur['peak_mb'] > base['peak_mb'] * (1 + TOLERANCE['peak_mb']) and cur['peak_mb'] - base['peak_mb'] > 1:
+                regressions.append(f"{size} {stage}: 内存 {base['peak_mb']:.1f}MB -> {cur['peak_mb']:.1f}MB")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="main.py 流水线基准测试")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help="规模列表, 格式为 标的数x交易日数")
+    parser.add_argument('--indicators', type=int, default=10, help="额外生成的比值指标数量")
+    parser.add_argument('--repeat', type=int, default=3, help="每个阶段计时重复次数 (取最短)")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="把本次结果写入基线文件")
+    parser.add_argument('--json', help="把本次结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = {}
+    for size in args.sizes:
+        report[size] = run_size(size, args.indicators, args.repeat)
+        print(f"\n== {size} (标的x交易日) ==")
+        print(pd.DataFrame(report[size]).T.to_string(float_format=lambda v: f"{v:.3f}"))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(report)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\n基线已更新: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\n没有基线文件, 可用 --update-baseline 生成")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(report, json.load(f))
+    if regressions:
+        print("\n性能退化:\n  " + "\n  ".join(regressions))
+        return 1
+    print("\n与基线相比没有退化")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
@@ -3,18 +3,49 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import requests
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+import aiohttp
 import os
+import sys
+import time
+import json
+import csv
+import asyncio
+import threading
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import re
+import pickle
+import hashlib
+import base64
+import copy
+import shutil
+import weakref
+from contextlib import contextmanager
 from datetime import datetime
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
 
 # =================配置区域=================
 
 # 1. 合成指数配置 (新增)
-# 定义如何用现有 ETF 合成新的指数
+# 定义如何用现有 ETF 合成新的指数, 成分也可以是另一个合成指数
+# method: price 直接加权股价 (早期口径, 没有除数); return 按收益率链式计算, 调仓日调整除数保证指数连续
+# rebalance: none / monthly / quarterly, 调仓日 (每个周期第一个交易日收盘) 权重重置为目标权重
 SYNTHETIC_CONFIG = {
     'ERH': {
         'name': '新可选消费',
-        'components': {'PEJ': 0.35, 'XHB': 0.35, 'XRT': 0.30}
+        'components': {'PEJ': 0.35, 'XHB': 0.35, 'XRT': 0.30},
+        'method': 'return',
+        'rebalance': 'quarterly',
+        'base': 100,
     }
 }
 
@@ -34,6 +65,20 @@ INDICATORS = [
     }
 ]
 
+# 2b. 比值扫描: 批量计算大量比值对 (板块两两组合 + 因子 ETF 对), 按趋势强弱排序,
+# 只有排名最靠前/最靠后的几个会和上面的核心指标一起推送和画图
+RATIO_SCAN = {
+    'enabled': os.environ.get("RATIO_SCAN", "1") == "1",
+    'sector_pairs': True,   # SECTOR_CONFIG 中所有板块两两组合
+    'pairs': [('MTUM', 'SPY'), ('QUAL', 'SPY'), ('VLUE', 'SPY'), ('USMV', 'SPY'), ('IWM', 'SPY'), ('RSP', 'SPY')],
+    'score_window': 60,     # 打分: 最新比值相对 SMA(score_window) 的偏离
+    'top_n': 3,             # 最强、最弱各选几个
+    # 看板默认只在标题下列出选出的比值, 不画曲线 (每个比值 7 条曲线 × 各周期, 页面体积翻倍);
+    # 打开后只画最近一段 (各周期), None 表示画全部历史
+    'plot': os.environ.get("RATIO_SCAN_PLOT", "0") == "1",
+    'plot_history': {'D': '6mo', 'W': '2y', 'M': None},
+}
+
 # 3. 板块配置
 # 注意：这里我们把 XLY 换成了 ERH
 SECTOR_CONFIG = {
@@ -53,8 +98,160 @@ SECTOR_CONFIG = {
     }
 }
 
+# 4. 本地价格缓存
+# 每个 Ticker 的收盘价存成一个 Parquet 文件, 每次运行只增量拉取缺失的日期
+CACHE_CONFIG = {
+    'enabled': os.environ.get("PRICE_CACHE", "1") != "0",
+    'dir': os.environ.get("PRICE_CACHE_DIR", "data_cache"),
+    'overlap_days': 5,  # 增量下载时与缓存重叠的交易日数, 用于发现复权调整
+}
+
+# 计算结果缓存: RRG、指标、比值扫描的结果按 (输入价格切片 + 相关配置) 的哈希存盘, 只改看板或推送文案时直接复用
+RESULT_CACHE = {
+    'enabled': os.environ.get("RESULT_CACHE", "1") != "0",
+    'dir': os.path.join(CACHE_CONFIG['dir'], "results"),
+    'max_bytes': 256 * 1024 * 1024,  # 超过后按最近使用时间淘汰
+    # 代码版本 (本文件内容的哈希) 也计入键: data_cache 会被 actions/cache 跨运行保留, 改了计算逻辑后旧结果必须失效
+    'version': hashlib.blake2b(open(os.path.abspath(__file__), 'rb').read(), digest_size=8).hexdigest(),
+}
+
+# 分块并发下载: 每块一次 yf.download, 有界线程池并发; 缺失的 Ticker 单独重试并指数退避
+DOWNLOAD_CONFIG = {
+    'chunk_size': 50,
+    'workers': 4,
+    'max_retries': 3,
+    'backoff': 2.0,  # 第 n 轮重试前等待 backoff * 2**(n-1) 秒
+}
+
+# 价格面板的数据类型; float32 内存减半, 计算 RRG/均线时会临时转回 float64
+PANEL_DTYPE = os.environ.get("PRICE_DTYPE", "float64")
+
+# 5. 价格数据源
+# yfinance: 在线下载; local: 读取本地快照 (目录或宽表文件); memory: 使用 set_memory_prices 注入的数据;
+# mmap: 读取内存映射的长历史价格库 (python main.py --build-store 生成)
+DATA_SOURCE = {
+    'provider': os.environ.get("PRICE_PROVIDER", "yfinance"),
+    'path': os.environ.get("PRICE_DATA_PATH", "price_snapshot"),
+    'snapshot_out': os.environ.get("PRICE_SNAPSHOT_OUT"),  # 设置后把本次获取的收盘价另存为本地快照
+}
+PRICE_PERIOD = os.environ.get("PRICE_PERIOD", "3y")  # 主流程使用的历史长度, 如 3y / 20y / max
+
+# 长历史价格库: 日期×Ticker 的定长二进制矩阵 (按行存储, 日期区间切片是连续内存) + JSON 索引
+MMAP_STORE = {
+    'dir': os.environ.get("PRICE_STORE_DIR", "price_store"),
+    'dtype': 'float32',
+    'tickers_file': os.environ.get("PRICE_STORE_TICKERS"),  # 可选: 每行一个 Ticker, 建库时追加到配置中的 Ticker
+    'chunk_rows': 2048,  # 重写价格库时每次搬运的行数
+}
+
+# 6. 盘中模式 (python main.py --stream)
+# K 线源可插拔, replay 为逐行回放本地 CSV (timestamp,ticker,close)
+STREAM_CONFIG = {
+    'source': os.environ.get("BAR_SOURCE", "replay"),
+    'replay_path': os.environ.get("BAR_REPLAY_PATH", "bars.csv"),
+    'replay_interval': float(os.environ.get("BAR_REPLAY_INTERVAL", "0")),  # 回放时每根 K 线之间的间隔秒数
+    'queue_size': 1000,
+}
+
+# 周期: 由日线重采样得到, 每个周期有自己的 RRG 窗口; 看板上可以切换 DASHBOARD_TIMEFRAMES 中的周期
+TIMEFRAMES = {
+    'D': {'label': '日线', 'rule': None, 'window_rs': 60, 'window_mom': 10},
+    'W': {'label': '周线', 'rule': 'W-FRI', 'window_rs': 12, 'window_mom': 4},
+    'M': {'label': '月线', 'rule': 'M', 'window_rs': 6, 'window_mom': 3},
+}
+DASHBOARD_TIMEFRAMES = os.environ.get("DASHBOARD_TIMEFRAMES", "D,W,M").split(',')
+
+# 7. 参数扫描 (python main.py --batch)
+# 对 基准 × RS 窗口 × 动量窗口 × 周期 的所有组合并行计算 RRG, 结果写入 CSV
+BATCH_GRID = {
+    'benchmarks': ['SPY', 'RSP'],
+    'tickers': None,  # None 表示使用 SECTOR_CONFIG 中的板块
+    'window_rs': [20, 40, 60, 120],
+    'window_mom': [5, 10, 20],
+    'frequency': ['D', 'W', 'M'],
+    'period': '10y',
+    'workers': None,  # None 表示使用全部 CPU 核
+    'output': 'rrg_batch.csv',
+}
+
+# 8. 轮动回测 (python main.py --backtest)
+# 每个交易日收盘按象限选出板块, 次日起等权持有, 换手按单边成本扣减
+BACKTEST_CONFIG = {
+    'period': '20y',
+    'hold_quadrants': ['leading', 'improving'],
+    'window_rs': 60,
+    'window_mom': 10,
+    'cost_bps': 5,      # 单边交易成本 (基点)
+    'rebalance': 'D',   # 调仓周期: D 每日, W 每周末, M 每月末
+    'output': 'backtest_equity.csv',
+}
+
+# 9. 看板输出
+DASHBOARD_CONFIG = {
+    'output': os.environ.get("DASHBOARD_OUTPUT", "index.html"),
+    # cdn: 引用 plotly 官方 CDN; inline: 把 5MB 的 plotly.js 整个写进 html (旧行为); 其他值视为 plotly.min.js 的路径/URL
+    'plotlyjs': os.environ.get("DASHBOARD_PLOTLYJS", "cdn"),
+    # inline: 图表数据写在 html 里; external: 另存为同名 .json, 页面加载时再 fetch
+    'payload': os.environ.get("DASHBOARD_PAYLOAD", "inline"),
+    'float32': True,  # 数值数组以 float32 二进制 (typed array) 编码
+    'title': '量化交易员看板',
+    # 多看板模式 (--all-dashboards) 的工作进程数, 0 表示 CPU 核数
+    'workers': int(os.environ.get("DASHBOARD_WORKERS", "0")),
+}
+# RRG 动画: 预先算好每个日期的坐标, 页面上播放/拖动, 尾迹长度在浏览器里切片
+ANIMATION_CONFIG = {
+    'enabled': os.environ.get("DASHBOARD_ANIMATION", "1") == "1",
+    'history': {'D': '1y', 'W': '3y', 'M': '5y'},  # 各周期动画覆盖的历史长度
+    'max_frames': 300,   # 超过则等间隔抽帧 (保留最新一帧), 控制页面体积
+    'tail': 5,           # 默认尾迹长度 (帧)
+    'interval_ms': 120,  # 播放速度
+}
+
+# 10. 运行报告: 每个阶段的耗时、CPU、内存峰值和处理量, 写成 JSON (可选 Prometheus 文本格式)
+RUN_REPORT_CONFIG = {
+    'json': os.environ.get("RUN_REPORT_PATH", "run_report.json"),
+    'prometheus': os.environ.get("RUN_REPORT_PROM"),  # 例如 run_report.prom, 供 node_exporter textfile 采集
+}
+
+# 11. 事件提醒: 全历史矩阵上找状态切换 (象限切换、均线突破、N 日新高/新低、DKJ 抵扣价突破),
+# 记录上次处理到的日期, 只推送之后新出现的事件
+EVENTS_CONFIG = {
+    'enabled': os.environ.get("EVENTS", "1") == "1",
+    'state_path': os.path.join(CACHE_CONFIG['dir'], "event_state.json"),
+    'cross_mas': ['sma60', 'ema120'],  # 比值上穿/下穿这些均线时提醒
+    'high_windows': [60, 252],         # 比值创 N 日新高/新低
+    'dkj': True,                       # 比值上穿/下穿 DKJ 抵扣价 (MA_WINDOWS 个交易日前的值)
+    'max_catchup': 5,                  # 状态过旧时最多补报最近几个交易日; 没有状态时只报最新一天
+    'max_per_kind': 15,                # 每类事件最多列出几条
+    # events: 只推送新事件 (没有事件就不推送); summary: 全量摘要 (旧行为); both: 两者都发
+    'telegram': os.environ.get("TELEGRAM_MODE", "events"),
+}
+
+# 12. 运行检查点: 按 交易日 + 配置哈希 保存各阶段结果, 同一天重跑 (失败重试或手动再触发) 时从断点继续
+RUN_STATE_CONFIG = {
+    'enabled': os.environ.get("RUN_STATE", "1") == "1",
+    'dir': os.path.join(CACHE_CONFIG['dir'], "runs"),
+    'keep': 5,  # 保留最近几个交易日的检查点目录
+    # 交易日按最近一个已收盘的交易时段计算: 收盘前手动运行归到上一个交易日, 收盘后的定时任务才算当天
+    'market_tz': 'America/New_York',
+    'close_hour': 16,
+}
+
+# 13. 外部配置文件: 一个文件里定义多个 universe / 指标组 / 看板, 用 --dashboard 或 DASHBOARD 环境变量选择看板
+# 格式见 dashboards.example.toml (也支持 .yaml, 需要 PyYAML); 文件不存在时使用本文件中的配置
+CONFIG_FILE = os.environ.get("RRG_CONFIG", "dashboards.toml")
+DASHBOARD_NAME = os.environ.get("DASHBOARD")
+
 TG_BOT_TOKEN = os.environ.get("TG_BOT_TOKEN")
-TG_CHAT_ID = os.environ.get("TG_CHAT_ID")
+TG_CHAT_ID = os.environ.get("TG_CHAT_ID")  # 多个会话/频道用逗号分隔
+TELEGRAM_CONFIG = {
+    'api_base': os.environ.get("TG_API_BASE", "https://api.telegram.org"),  # 测试时可指向本地 mock 服务
+    'max_concurrency': 10,      # 同时进行的请求数 (连接池大小)
+    'per_chat_interval': 1.0,   # 同一会话两条消息之间至少间隔的秒数 (Telegram 单会话约 1 条/秒)
+    'max_retries': 5,
+    'timeout': 20,
+    'chunk_size': 4096,         # Telegram 单条消息长度上限
+}
 
 COLORS = {
     'ema20': 'gray', 'sma20': '#D3D3D3',
@@ -64,99 +261,964 @@ COLORS = {
     'leading': '#2ca02c',   'weakening': '#e6aa00',
     'lagging': '#d62728',   'improving': '#1f77b4'
 }
+MA_WINDOWS = [20, 60, 120]  # 指标均线周期, 同时也是 DKJ 抵扣点的回看天数
+STREAM_STATE_PATH = os.environ.get("STREAM_STATE_PATH", os.path.join(CACHE_CONFIG['dir'], "stream_state.pkl"))
 # =========================================
 
-def get_data_and_synthesize(period="3y"):
-    """下载原始数据并计算合成指数"""
-    
-    # 1. 收集所有需要下载的真实 Ticker
-    # 包括 Benchmark, 板块列表里的真实Ticker, 指标里的真实Ticker, 合成公式里的成分股
-    real_tickers = set([SECTOR_CONFIG['BENCHMARK']])
-    
-    # 添加板块 (如果是合成的先跳过)
-    for sec in SECTOR_CONFIG['SECTORS'].keys():
-        if sec not in SYNTHETIC_CONFIG:
-            real_tickers.add(sec)
-            
-    # 添加指标成分 (如果是合成的先跳过)
-    for item in INDICATORS:
-        if item['numerator'] not in SYNTHETIC_CONFIG: real_tickers.add(item['numerator'])
-        if item['denominator'] not in SYNTHETIC_CONFIG: real_tickers.add(item['denominator'])
-        
-    # 添加合成指数的成分股 (PEJ, XHB, XRT 等)
-    for synth_name, config in SYNTHETIC_CONFIG.items():
-        for component in config['components'].keys():
-            real_tickers.add(component)
+# ================= 运行报告 =================
+
+RUN_REPORT = {'stages': {}, 'counters': {}, 'failed_tickers': []}
 
-    print(f"正在下载原始数据: {real_tickers} ...")
+def _peak_rss_mb():
+    """进程迄今为止的 RSS 峰值 (MB); 没有 resource 模块的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+@contextmanager
+def track_stage(name):
+    """记录一个阶段的墙钟/CPU 耗时和结束时的 RSS 峰值, yield 出的 dict 可以补充处理量等字段"""
+    stage = RUN_REPORT['stages'].setdefault(name, {})
+    wall0, cpu0 = time.perf_counter(), time.process_time()
     try:
-        data = yf.download(list(real_tickers), period=period, group_by='ticker', auto_adjust=True)
-        
-        # 整理 DataFrame
-        df_close = pd.DataFrame()
-        for t in real_tickers:
-            try:
-                if (t, 'Close') in data.columns:
-                    df_close[t] = data[(t, 'Close')]
-                elif t in data.columns:
-                     # 处理单 Ticker 下载情况
-                    col_data = data[t]
-                    if isinstance(col_data, pd.DataFrame):
-                        df_close[t] = col_data['Close']
-                    else:
-                        df_close[t] = col_data
-            except Exception:
-                pass
-        
-        # 2. 计算合成指数 (ERH)
-        # 逻辑：加权求和。虽然严谨的指数需要除数调整，但作为 Proxy，直接加权股价即可反映趋势。
-        for synth_name, config in SYNTHETIC_CONFIG.items():
-            print(f"正在计算合成指数: {synth_name} ...")
-            try:
-                # 初始化为0
-                composite_series = pd.Series(0, index=df_close.index)
-                valid_calc = True
-                
-                for ticker, weight in config['components'].items():
-                    if ticker in df_close.columns:
-                        composite_series += df_close[ticker] * weight
-                    else:
-                        print(f"缺少成分股 {ticker} 数据，无法合成 {synth_name}")
-                        valid_calc = False
-                        break
-                
-                if valid_calc:
-                    df_close[synth_name] = composite_series
-            except Exception as e:
-                print(f"合成 {synth_name} 失败: {e}")
+        yield stage
+    finally:
+        stage['wall_seconds'] = round(time.perf_counter() - wall0, 4)
+        stage['cpu_seconds'] = round(time.process_time() - cpu0, 4)
+        stage['peak_rss_mb'] = _peak_rss_mb()
 
-        return df_close
-        
+def record_metric(name, value=1):
+    """累加一个计数器, 例如下载请求数、重试次数、字节数"""
+    RUN_REPORT['counters'][name] = RUN_REPORT['counters'].get(name, 0) + value
+
+def _yf_download(tickers, **kwargs):
+    """yf.download 的包装, 统计请求次数和返回的数据量"""
+    record_metric('download_requests')
+    data = yf.download(tickers, **kwargs)
+    record_metric('download_bytes', int(data.memory_usage(deep=True).sum()))  # 解析后的数据量, yfinance 不暴露原始响应大小
+    return data
+
+def _prometheus_text(report):
+    lines = []
+    for field in sorted({k for st in report['stages'].values() for k, v in st.items() if isinstance(v, (int, float))}):
+        lines.append(f"# TYPE rrg_stage_{field} gauge")
+        for stage, values in report['stages'].items():
+            if isinstance(values.get(field), (int, float)):
+                lines.append(f'rrg_stage_{field}{{stage="{stage}"}} {values[field]}')
+    for name, value in sorted(report['counters'].items()):
+        lines += [f"# TYPE rrg_{name} counter", f"rrg_{name} {value}"]
+    lines += ["# TYPE rrg_run_success gauge", f"rrg_run_success {int(report['status'] == 'ok')}"]
+    return "\n".join(lines) + "\n"
+
+def write_run_report(status='ok', error=None):
+    """把运行报告写成 JSON, 配置了 prometheus 路径时再写一份文本格式"""
+    report = dict(RUN_REPORT, status=status, error=error, finished_at=datetime.now().isoformat(timespec='seconds'),
+                  total_wall_seconds=round(sum(st.get('wall_seconds', 0) for st in RUN_REPORT['stages'].values()), 4))
+    with open(RUN_REPORT_CONFIG['json'], 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+    if RUN_REPORT_CONFIG['prometheus']:
+        with open(RUN_REPORT_CONFIG['prometheus'], 'w') as f:
+            f.write(_prometheus_text(report))
+    print(f"运行报告: " + ", ".join(f"{k} {v['wall_seconds']}s" for k, v in RUN_REPORT['stages'].items()))
+
+# ================= 外部配置 =================
+
+def load_config_file(path=None):
+    """读取 TOML / YAML 配置文件, 文件不存在返回 None"""
+    path = path or CONFIG_FILE
+    if not path or not os.path.exists(path):
+        return None
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError(f"读取 {path} 需要安装 PyYAML, 或改用 TOML 格式")
+        with open(path, encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+    if tomllib is None:
+        raise RuntimeError(f"读取 {path} 需要 Python 3.11+ (tomllib)")
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+_DEFAULT_SETTINGS = None
+
+def current_settings():
+    """当前生效的看板配置 (apply_dashboard_settings 的逆操作)"""
+    return copy.deepcopy({
+        'name': None, 'sector_config': SECTOR_CONFIG, 'indicators': INDICATORS, 'synthetic_config': SYNTHETIC_CONFIG,
+        'ratio_scan': RATIO_SCAN, 'timeframes': DASHBOARD_TIMEFRAMES, 'output': DASHBOARD_CONFIG['output'],
+        'title': DASHBOARD_CONFIG['title'], 'chat_id': TG_CHAT_ID,
+        'event_state_path': EVENTS_CONFIG['state_path'], 'stream_state_path': STREAM_STATE_PATH,
+    })
+
+def dashboard_settings(config, name=None):
+    """把配置文件中的一个看板解析为完整配置; 文件里没写的部分沿用本文件中的默认配置"""
+    global _DEFAULT_SETTINGS
+    if _DEFAULT_SETTINGS is None:
+        _DEFAULT_SETTINGS = current_settings()
+    base = copy.deepcopy(_DEFAULT_SETTINGS)
+    dashboards = config.get('dashboards') or {}
+    if not dashboards:
+        if name:
+            raise ValueError(f"配置文件中没有定义看板, 无法选择 {name}")
+        return base
+    name = name or config.get('default_dashboard') or next(iter(dashboards))
+    if name not in dashboards:
+        raise ValueError(f"配置文件中没有看板 {name}, 可选: {', '.join(dashboards)}")
+    dash = dashboards[name]
+
+    settings = dict(base, name=name)
+    settings['synthetic_config'] = {**base['synthetic_config'], **config.get('synthetics', {})}
+    if 'universe' in dash:
+        universes = config.get('universes', {})
+        if dash['universe'] not in universes:
+            raise ValueError(f"看板 {name} 引用了不存在的 universe: {dash['universe']}")
+        universe = universes[dash['universe']]
+        settings['sector_config'] = {'BENCHMARK': universe['benchmark'], 'SECTORS': dict(universe['sectors'])}
+    if 'benchmark' in dash:
+        settings['sector_config']['BENCHMARK'] = dash['benchmark']
+    if 'indicators' in dash:
+        sets = [dash['indicators']] if isinstance(dash['indicators'], str) else dash['indicators']
+        missing = [n for n in sets if n not in config.get('indicator_sets', {})]
+        if missing:
+            raise ValueError(f"看板 {name} 引用了不存在的指标组: {missing}")
+        settings['indicators'] = [dict(item) for n in sets for item in config['indicator_sets'][n]]
+    settings['ratio_scan'] = {**base['ratio_scan'], **dash.get('ratio_scan', {})}
+    settings['timeframes'] = list(dash.get('timeframes', base['timeframes']))
+    settings['output'] = dash.get('output', f"{name}.html")
+    settings['title'] = dash.get('title', base['title'])
+    settings['chat_id'] = dash.get('chat_id', base['chat_id'])
+    # 每个看板的事件状态和增量状态分开保存, 互不覆盖
+    settings['event_state_path'] = os.path.join(CACHE_CONFIG['dir'], f"event_state_{name}.json")
+    settings['stream_state_path'] = os.path.join(CACHE_CONFIG['dir'], f"stream_state_{name}.pkl")
+    return settings
+
+def apply_dashboard_settings(settings):
+    """把看板配置写回模块级配置, 之后的取数、计算、出图和推送都按该看板进行"""
+    global SECTOR_CONFIG, INDICATORS, SYNTHETIC_CONFIG, RATIO_SCAN, DASHBOARD_TIMEFRAMES, TG_CHAT_ID, STREAM_STATE_PATH
+    SECTOR_CONFIG = settings['sector_config']
+    INDICATORS = settings['indicators']
+    SYNTHETIC_CONFIG = settings['synthetic_config']
+    RATIO_SCAN = settings['ratio_scan']
+    DASHBOARD_TIMEFRAMES = settings['timeframes']
+    TG_CHAT_ID = settings['chat_id']
+    STREAM_STATE_PATH = settings['stream_state_path']
+    DASHBOARD_CONFIG.update(output=settings['output'], title=settings['title'])
+    EVENTS_CONFIG['state_path'] = settings['event_state_path']
+
+def apply_dashboard(name=None, path=None):
+    """从配置文件选择看板并生效; 没有配置文件时保持本文件中的配置 (此时不能指定看板名)"""
+    config = load_config_file(path)
+    if config is None:
+        if name:
+            raise ValueError(f"找不到配置文件 {path or CONFIG_FILE}, 无法选择看板 {name}")
+        return None
+    settings = dashboard_settings(config, name)
+    apply_dashboard_settings(settings)
+    if settings['name']:
+        real, synthetics = resolve_tickers(settings['sector_config'], settings['indicators'], settings['synthetic_config'], settings['ratio_scan'])
+        print(f"看板 {settings['name']}: {len(real)} 个 Ticker, 合成指数 {synthetics or '无'} -> {settings['output']}")
+    return settings
+
+# ================= 运行检查点 =================
+
+def run_config_hash():
+    """影响计算结果和输出的配置 (以及代码版本) 的哈希, 配置或代码一变就换一个检查点目录"""
+    config = {'period': PRICE_PERIOD, 'source': DATA_SOURCE, 'synthetic': SYNTHETIC_CONFIG, 'sectors': SECTOR_CONFIG,
+              'indicators': INDICATORS, 'ratio_scan': RATIO_SCAN, 'ma_windows': MA_WINDOWS, 'timeframes': TIMEFRAMES,
+              'dashboard_timeframes': DASHBOARD_TIMEFRAMES, 'events': EVENTS_CONFIG, 'animation': ANIMATION_CONFIG,
+              'dashboard': DASHBOARD_CONFIG, 'code': RESULT_CACHE['version']}
+    text = json.dumps(config, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+def expected_session(now=None):
+    """最近一个已收盘的交易日 (市场时区收盘之后才算当天, 周末向前取到周五; 节假日不单独处理)"""
+    now = pd.Timestamp.now(tz=RUN_STATE_CONFIG['market_tz']) if now is None else pd.Timestamp(now).tz_convert(RUN_STATE_CONFIG['market_tz'])
+    day = now.tz_localize(None).normalize()
+    if now.hour < RUN_STATE_CONFIG['close_hour']:
+        day -= pd.Timedelta(days=1)
+    return pd.offsets.BDay().rollback(day)
+
+def open_run_state(date=None, fresh=False):
+    """本次运行的检查点目录: 交易日 (默认 expected_session()) + 配置哈希; fresh 时先清空; 只保留最近 keep 个交易日的目录
+    (同一交易日可能有多个看板的目录, 它们可能正在并行运行, 所以按交易日而不是按目录数淘汰)"""
+    date = expected_session() if date is None else pd.offsets.BDay().rollback(pd.Timestamp(date))
+    name = f"{date:%Y-%m-%d}_{run_config_hash()}"
+    run_dir = os.path.join(RUN_STATE_CONFIG['dir'], name)
+    if fresh:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir, exist_ok=True)
+    runs = os.listdir(RUN_STATE_CONFIG['dir'])
+    expired = sorted({r.split('_')[0] for r in runs})[:-RUN_STATE_CONFIG['keep']]
+    for old in runs:
+        if old.split('_')[0] in expired:
+            shutil.rmtree(os.path.join(RUN_STATE_CONFIG['dir'], old), ignore_errors=True)
+    return run_dir
+
+def has_checkpoint(run_dir, name):
+    return bool(run_dir) and os.path.exists(os.path.join(run_dir, f"{name}.pkl"))
+
+def load_checkpoint(run_dir, name):
+    """读取一个阶段的检查点, 不存在或损坏时返回 None"""
+    path = os.path.join(run_dir, f"{name}.pkl") if run_dir else None
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
     except Exception as e:
-        print(f"数据处理严重错误: {e}")
+        print(f"检查点 {path} 读取失败, 重新计算: {e}")
+        return None
+
+def save_checkpoint(run_dir, name, value):
+    """先写临时文件再改名, 中途失败不会留下半个检查点"""
+    if not run_dir:
+        return
+    path = os.path.join(run_dir, f"{name}.pkl")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+def checkpoint(run_dir, name, compute, complete=None):
+    """有检查点就直接读取, 否则调用 compute() 计算并保存; 空结果和 complete(value) 为假的结果不保存, 下次重跑会重新计算"""
+    value = load_checkpoint(run_dir, name)
+    if value is not None:
+        print(f"从检查点恢复: {name}")
+        record_metric('checkpoint_hits')
+        return value
+    value = compute()
+    if value is not None and not getattr(value, 'empty', False) and (complete is None or complete(value)):
+        save_checkpoint(run_dir, name, value)
+    return value
+
+def panel_complete(df_close):
+    """价格面板能否作为检查点: 有 Ticker 下载失败 (同日重跑正是为了补下这些 Ticker),
+    或在线数据还没更新到预期的交易日时都不能; 离线数据源的最后一天由快照决定, 不检查日期"""
+    if RUN_REPORT['failed_tickers']:
+        print(f"有 Ticker 下载失败, 本次不写检查点, 重跑时会重新下载: {RUN_REPORT['failed_tickers']}")
+        return False
+    session = expected_session()
+    if DATA_SOURCE['provider'] == 'yfinance' and df_close.index[-1] < session:
+        print(f"数据只到 {df_close.index[-1].date()}, 尚未包含交易日 {session.date()}, 本次不写检查点")
+        return False
+    return True
+
+def save_checkpoint_files(run_dir, name, paths):
+    """把输出文件 (如看板 html) 复制一份到检查点目录"""
+    if not run_dir:
+        return
+    os.makedirs(os.path.join(run_dir, name), exist_ok=True)
+    for path in paths:
+        shutil.copyfile(path, os.path.join(run_dir, name, os.path.basename(path)))
+
+def restore_checkpoint_files(run_dir, name, paths):
+    """检查点中有全部文件时复制回原位置, 返回是否恢复成功"""
+    saved = [os.path.join(run_dir, name, os.path.basename(p)) for p in paths] if run_dir else []
+    if not saved or not all(os.path.exists(p) for p in saved):
+        return False
+    for src, dst in zip(saved, paths):
+        shutil.copyfile(src, dst)
+    print(f"从检查点恢复: {name}")
+    record_metric('checkpoint_hits')
+    return True
+
+def expand_ticker(ticker, synthetic_config=None):
+    """把 Ticker 展开成需要下载的真实 Ticker (合成指数递归展开为成分股)"""
+    synthetic_config = SYNTHETIC_CONFIG if synthetic_config is None else synthetic_config
+    if ticker not in synthetic_config:
+        return {ticker}
+    return set().union(*(expand_ticker(c, synthetic_config) for c in synthetic_config[ticker]['components']))
+
+def resolve_tickers(sector_config, indicators, synthetic_config, ratio_scan, extra=()):
+    """一个看板实际用到的数据: 返回 (需要下载的真实 Ticker 集合, 需要计算的合成指数名)
+    只展开被引用到的合成指数 (包括嵌套的成分指数), 没用到的合成指数及其成分不下载"""
+    # 包括 Benchmark, 板块列表里的Ticker, 指标里的Ticker, 比值扫描的Ticker
+    names = [sector_config['BENCHMARK'], *sector_config['SECTORS'].keys()]
+    for item in indicators:
+        names += [item['numerator'], item['denominator']]
+    if ratio_scan['enabled']:
+        names += [t for pair in ratio_scan['pairs'] for t in pair]
+    names += list(extra)
+    real, synthetics = set(), set()
+
+    def visit(name):
+        if name not in synthetic_config:
+            real.add(name)
+        elif name not in synthetics:
+            synthetics.add(name)
+            for c in synthetic_config[name]['components']:
+                visit(c)
+
+    for name in names:
+        visit(name)
+    return real, [n for n in synthetic_order(synthetic_config) if n in synthetics]
+
+def collect_real_tickers(extra=()):
+    """收集所有需要下载的真实 Ticker (extra 为额外需要的 Ticker, 可以是合成指数); 合成指数展开为成分股"""
+    return resolve_tickers(SECTOR_CONFIG, INDICATORS, SYNTHETIC_CONFIG, RATIO_SCAN, extra)[0]
+
+def extract_closes(data, tickers):
+    """从 yf.download 的结果中整理出收盘价 DataFrame"""
+    if isinstance(data.columns, pd.MultiIndex) and 'Close' in data.columns.get_level_values(1):
+        # yfinance 的 Volume 是 int64, 和价格字段不在同一个数据块里, 无法整块 reshape 成视图; 一次 xs 只拷贝 Close 列
+        closes = data.xs('Close', axis=1, level=1)
+        wanted = [t for t in closes.columns if t in set(tickers)]
+        return closes if len(wanted) == closes.shape[1] else closes[wanted]
+
+    # 处理单 Ticker 下载的扁平列
+    df_close = pd.DataFrame(index=data.index)
+    for t in tickers:
+        if t in data.columns:
+            df_close[t] = data[t]
+        elif 'Close' in data.columns and len(tickers) == 1:
+            df_close[t] = data['Close']
+    return df_close
+
+def _download_chunk(tickers, kwargs):
+    """下载一块 Ticker, 返回收盘价; 整块失败时返回空表, 交给单 Ticker 重试"""
+    try:
+        data = _yf_download(tickers, group_by='ticker', auto_adjust=True, threads=False, progress=False, **kwargs)
+        return extract_closes(data, tickers)
+    except Exception as e:
+        print(f"分块下载失败 {tickers[:3]}... ({len(tickers)} 个): {e}")
         return pd.DataFrame()
 
-def calculate_rrg_components(df_close):
-    """计算 RRG 坐标"""
-    benchmark = SECTOR_CONFIG['BENCHMARK']
-    sectors = SECTOR_CONFIG['SECTORS'].keys()
-    rrg_data = {}
-    
-    window_rs = 60
-    window_mom = 10 
+def download_closes(tickers, **kwargs):
+    """分块并发下载收盘价, 缺失的 Ticker 按轮重试; 部分失败只记录不中断 (kwargs 透传 period/start)"""
+    tickers = sorted(tickers)
+    size = DOWNLOAD_CONFIG['chunk_size']
+    chunks = [tickers[i:i + size] for i in range(0, len(tickers), size)]
+    # yfinance 1.4.0 起每次 download 调用使用独立状态 (requirements.txt 里固定了下限), 可以在多个线程里同时调用
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_CONFIG['workers']) as pool:
+        frames = list(pool.map(lambda chunk: _download_chunk(chunk, kwargs), chunks))
+        closes = {t: f[t] for f in frames for t in f.columns if f[t].notna().any()}
+
+        # 每轮只等待一次, 然后把仍然缺失的 Ticker 逐个并发重试
+        for attempt in range(1, DOWNLOAD_CONFIG['max_retries'] + 1):
+            missing = [t for t in tickers if t not in closes]
+            if not missing:
+                break
+            time.sleep(DOWNLOAD_CONFIG['backoff'] * 2 ** (attempt - 1))
+            record_metric('download_retries', len(missing))
+            for t, df in zip(missing, pool.map(lambda t: _download_chunk([t], kwargs), missing)):
+                if t in df.columns and df[t].notna().any():
+                    closes[t] = df[t]
+
+    failed = [t for t in tickers if t not in closes]
+    if failed:
+        print(f"以下 Ticker 下载失败, 本次跳过: {failed}")
+        RUN_REPORT['failed_tickers'] += failed
+        record_metric('download_failed', len(failed))
+    return pd.DataFrame(closes)
+
+def _period_start(period, end=None):
+    """把 '3y' / '6mo' / '10d' / 'ytd' 这类 period 换算成起始日期 (默认相对今天), 'max' 返回 None"""
+    if not period or period == 'max':
+        return None
+    end = pd.Timestamp(datetime.now().date()) if end is None else pd.Timestamp(end)
+    if period == 'ytd':
+        return pd.Timestamp(year=end.year, month=1, day=1)
+    m = re.fullmatch(r'(\d+)(d|wk|mo|y)', period)
+    if m is None:
+        raise ValueError(f"不支持的 period: {period!r} (可用 '10d' / '2wk' / '6mo' / '3y' / 'ytd' / 'max')")
+    num, unit = int(m.group(1)), m.group(2)
+    offset = {'d': pd.DateOffset(days=num), 'wk': pd.DateOffset(weeks=num),
+              'mo': pd.DateOffset(months=num), 'y': pd.DateOffset(years=num)}[unit]
+    return end - offset
+
+def _cache_path(ticker):
+    return os.path.join(CACHE_CONFIG['dir'], f"{ticker}.parquet")
+
+def load_cached_close(ticker):
+    """读取单个 Ticker 的缓存收盘价, 没有缓存返回 None"""
+    path = _cache_path(ticker)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)['Close'].dropna()
+    except Exception as e:
+        print(f"缓存 {path} 读取失败, 将重新下载: {e}")
+        return None
+
+def save_cached_close(ticker, series):
+    os.makedirs(CACHE_CONFIG['dir'], exist_ok=True)
+    series.rename('Close').to_frame().to_parquet(_cache_path(ticker))
 
-    for sec in sectors:
-        # 检查数据是否存在 (ERH 已经在上一步合成进去了，所以这里能找到)
-        if sec not in df_close.columns or benchmark not in df_close.columns:
+def history_adjusted(old, new, rtol=1e-6):
+    """重叠日期上新旧收盘价对不上时返回 True: auto_adjust 下分红/拆股会整体改写历史价格"""
+    common = old.index.intersection(new.index)
+    a, b = old[common].to_numpy(dtype=np.float64), new[common].to_numpy(dtype=np.float64)
+    valid = np.isfinite(a) & np.isfinite(b)
+    return bool(valid.any()) and not np.allclose(a[valid], b[valid], rtol=rtol)
+
+def fetch_closes_incremental(tickers, period="3y"):
+    """读取本地缓存, 每个 Ticker 只下载缺失的日期区间并追加回缓存"""
+    start = _period_start(period)
+    overlap = CACHE_CONFIG['overlap_days']
+    cached, groups, full = {}, {}, set()
+
+    for t in tickers:
+        s = load_cached_close(t)
+        # 没有缓存, 或缓存起点晚于需要的起点 (放宽一周以跳过周末/假期) -> 全量下载
+        if s is None or len(s) <= overlap or (start is not None and s.index[0] > start + pd.Timedelta(days=7)):
+            full.add(t)
             continue
-            
-        rs_raw = df_close[sec] / df_close[benchmark]
-        rs_ma = rs_raw.rolling(window=window_rs).mean()
-        r_ratio = 100 * (rs_raw / rs_ma)
-        mom_ma = r_ratio.rolling(window=window_mom).mean()
-        r_mom = 100 * (r_ratio / mom_ma)
-        
-        config_val = SECTOR_CONFIG['SECTORS'][sec]
+        cached[t] = s
+        # 从倒数第 overlap 个交易日开始拉取, 重叠部分用来检测复权价是否被整体调整
+        groups.setdefault(s.index[-overlap], []).append(t)
+
+    fresh = {}
+    for fetch_start, group in groups.items():
+        print(f"增量下载 {group} (自 {fetch_start.date()}) ...")
+        new_close = download_closes(group, start=fetch_start.strftime('%Y-%m-%d'))
+        for t in group:
+            old = cached[t]
+            new = new_close[t].dropna() if t in new_close.columns else pd.Series(dtype=float)
+            # 分红/拆股后 auto_adjust 会改写全部历史价格, 重叠段对不上时整段重新下载
+            if history_adjusted(old, new):
+                full.add(t)
+                continue
+            fresh[t] = pd.concat([old[old.index < new.index[0]], new]) if len(new) else old
+
+    if full:
+        print(f"全量下载 {sorted(full)} ...")
+        new_close = download_closes(full, period=period)
+        for t in full:
+            if t in new_close.columns:
+                fresh[t] = new_close[t].dropna()
+
+    for t, s in fresh.items():
+        if len(s):
+            save_cached_close(t, s)
+
+    df_close = pd.DataFrame(fresh)
+    if start is not None:
+        df_close = df_close[df_close.index >= start]
+    return df_close
+
+def fetch_yfinance(tickers, period="3y"):
+    """数据源: yfinance 在线下载 (启用缓存时走增量下载)"""
+    if CACHE_CONFIG['enabled']:
+        return fetch_closes_incremental(tickers, period)
+    return download_closes(tickers, period=period)
+
+def _slice_snapshot(df_close, tickers, period):
+    """按 period 截取快照; 起点相对快照最后一天计算, 保证离线运行结果可复现"""
+    missing = set(tickers) - set(df_close.columns)
+    if missing:
+        print(f"本地快照缺少: {sorted(missing)}")
+    df_close = df_close[[t for t in df_close.columns if t in tickers]]
+    start = _period_start(period, end=df_close.index.max()) if len(df_close) else None
+    return df_close[df_close.index >= start] if start is not None else df_close
+
+def fetch_local_files(tickers, period="3y"):
+    """数据源: 本地快照. path 是目录时读取 <TICKER>.parquet / <TICKER>.csv, 是文件时按宽表读取"""
+    path = DATA_SOURCE['path']
+    if os.path.isfile(path):
+        df_close = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path, index_col=0, parse_dates=True)
+        return _slice_snapshot(df_close, tickers, period)
+
+    closes = {}
+    for t in tickers:
+        pq_path, csv_path = os.path.join(path, f"{t}.parquet"), os.path.join(path, f"{t}.csv")
+        if os.path.exists(pq_path):
+            df = pd.read_parquet(pq_path)
+        elif os.path.exists(csv_path):
+            df = pd.read_csv(csv_path, index_col=0, parse_dates=True)
+        else:
+            continue
+        closes[t] = df['Close'] if 'Close' in df.columns else df.iloc[:, 0]
+    return _slice_snapshot(pd.DataFrame(closes), tickers, period)
+
+def fetch_memory(tickers, period="3y"):
+    """数据源: 内存中的 DataFrame (通过 set_memory_prices 注入), 用于基准测试和回归测试"""
+    return _slice_snapshot(MEMORY_PRICES, tickers, period)
+
+def set_memory_prices(df_close):
+    global MEMORY_PRICES
+    MEMORY_PRICES = df_close
+
+def save_price_snapshot(df_close, path):
+    """把收盘价按 <TICKER>.parquet 写到目录, 之后可用 local 数据源离线回放"""
+    os.makedirs(path, exist_ok=True)
+    for t in df_close.columns:
+        df_close[t].dropna().rename('Close').to_frame().to_parquet(os.path.join(path, f"{t}.parquet"))
+
+# ================= 长历史价格库 =================
+# values.bin 为 (日期×Ticker) 的 np.memmap, index.json 记录 dtype、Ticker 顺序和日期;
+# 读取时只映射文件, 切片时才真正读入需要的行列, 多 GB 的历史也不必整体装进内存。
+
+def _store_paths(path):
+    return os.path.join(path, "values.bin"), os.path.join(path, "index.json")
+
+def open_price_store(path=None):
+    """打开价格库, 返回 memmap 和索引; 不存在时返回 None"""
+    path = path or MMAP_STORE['dir']
+    values_path, index_path = _store_paths(path)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        meta = json.load(f)
+    dates = pd.DatetimeIndex(meta['dates'])
+    shape = (len(dates), len(meta['tickers']))
+    values = np.memmap(values_path, dtype=meta['dtype'], mode='r', shape=shape) if all(shape) else np.empty(shape, meta['dtype'])
+    return {'values': values, 'dates': dates, 'tickers': meta['tickers'],
+            'columns': {t: j for j, t in enumerate(meta['tickers'])}, 'dtype': meta['dtype'], 'path': path}
+
+def slice_price_store(store, tickers=None, start=None, end=None):
+    """按日期区间和 Ticker 取出 DataFrame; 日期区间是 memmap 的视图, 只有选中的列会被读入内存"""
+    lo = store['dates'].searchsorted(pd.Timestamp(start)) if start is not None else 0
+    hi = store['dates'].searchsorted(pd.Timestamp(end), side='right') if end is not None else len(store['dates'])
+    rows = store['values'][lo:hi]
+    if tickers is None:
+        cols = list(store['tickers'])
+        block = np.array(rows)
+    else:
+        cols = [t for t in tickers if t in store['columns']]
+        block = rows[:, [store['columns'][t] for t in cols]]
+    return pd.DataFrame(block, index=store['dates'][lo:hi], columns=cols, copy=False)
+
+def _write_store_meta(path, dtype, tickers, dates):
+    with open(_store_paths(path)[1], 'w') as f:
+        json.dump({'dtype': np.dtype(dtype).str, 'tickers': list(tickers), 'dates': [d.strftime('%Y-%m-%d') for d in dates]}, f)
+
+def write_price_store(df_close, path=None, dtype=None):
+    """把收盘价整体写成价格库 (覆盖已有的库), 按行块写入"""
+    path, dtype = path or MMAP_STORE['dir'], np.dtype(dtype or MMAP_STORE['dtype'])
+    os.makedirs(path, exist_ok=True)
+    df_close = df_close.sort_index()
+    if df_close.size:
+        out = np.memmap(_store_paths(path)[0], dtype=dtype, mode='w+', shape=df_close.shape)
+        step = MMAP_STORE['chunk_rows']
+        for i in range(0, len(df_close), step):
+            out[i:i + step] = df_close.iloc[i:i + step].to_numpy(dtype=dtype)
+        out.flush()
+        del out
+    _write_store_meta(path, dtype, df_close.columns, df_close.index)
+
+def update_price_store(df_close, path=None):
+    """把新数据合并进价格库: 只有新日期时在文件末尾追加行; 出现新 Ticker 或早于库起点的日期
+    (例如 3y 的库扩展到 20y) 时按行块重写整个库; 重叠日期上价格对不上 (复权价被整体调整) 的 Ticker 重写整列历史"""
+    path = path or MMAP_STORE['dir']
+    store = open_price_store(path)
+    if store is None:
+        return write_price_store(df_close, path)
+
+    tickers = list(store['tickers']) + [t for t in df_close.columns if t not in store['columns']]
+    first, last = store['dates'][0], store['dates'][-1]
+    pre_rows = df_close[df_close.index < first].reindex(columns=tickers)
+    new_rows = df_close[df_close.index > last].reindex(columns=tickers)
+    dates = pre_rows.index.append(store['dates']).append(new_rows.index)
+    values_path = _store_paths(path)[0]
+    dtype = np.dtype(store['dtype'])
+
+    # 只读入和新数据重叠的那段行来比较
+    overlap = slice_price_store(store, [t for t in df_close.columns if t in store['columns']], start=df_close.index.min())
+    adjusted = [t for t in overlap.columns if history_adjusted(overlap[t], df_close[t])]
+    if adjusted:
+        print(f"复权价已调整, 重写历史: {adjusted}")
+
+    # 库里原有的行在新文件中的位置: [p, p + old_rows)
+    p, old_rows = len(pre_rows), len(store['dates'])
+    if len(tickers) == len(store['tickers']) and not p:
+        del store, overlap
+        with open(values_path, 'r+b') as f:
+            f.truncate(len(dates) * len(tickers) * dtype.itemsize)
+        out = np.memmap(values_path, dtype=dtype, mode='r+', shape=(len(dates), len(tickers)))
+        out[old_rows:] = new_rows.to_numpy(dtype=dtype)
+    else:
+        tmp_path = values_path + '.tmp'
+        out = np.memmap(tmp_path, dtype=dtype, mode='w+', shape=(len(dates), len(tickers)))
+        out[:] = np.nan
+        step, n_old = MMAP_STORE['chunk_rows'], len(store['tickers'])
+        out[:p] = pre_rows.to_numpy(dtype=dtype)
+        for i in range(0, old_rows, step):
+            end = min(i + step, old_rows)
+            out[p + i:p + end, :n_old] = store['values'][i:end]
+        # 新 Ticker 在已有日期上的历史
+        hist = df_close.reindex(index=store['dates'], columns=tickers[n_old:])
+        out[p:p + old_rows, n_old:] = hist.to_numpy(dtype=dtype)
+        out[p + old_rows:] = new_rows.to_numpy(dtype=dtype)
+        del store, overlap
+    for t in adjusted:
+        j = tickers.index(t)
+        old = np.asarray(out[p:p + old_rows, j], dtype=np.float64)
+        new = df_close[t].reindex(dates[p:p + old_rows]).to_numpy(dtype=np.float64)
+        # 新数据覆盖的日期直接替换; 更早的日期按第一个重叠日的新旧比例缩放 (复权因子在调整事件之前是常数)
+        both = np.flatnonzero(np.isfinite(old) & np.isfinite(new))
+        factor = new[both[0]] / old[both[0]]
+        out[p:p + old_rows, j] = np.where(np.isfinite(new), new, old * factor)
+    out.flush()
+    del out
+    if os.path.exists(values_path + '.tmp'):
+        os.replace(values_path + '.tmp', values_path)
+    _write_store_meta(path, dtype, tickers, dates)
+
+def fetch_price_store(tickers, period="3y"):
+    """数据源: 内存映射价格库, 只读取需要的 Ticker 和日期区间"""
+    store = open_price_store()
+    if store is None:
+        raise FileNotFoundError(f"价格库 {MMAP_STORE['dir']} 不存在, 请先运行 python main.py --build-store")
+    missing = set(tickers) - set(store['columns'])
+    if missing:
+        print(f"价格库缺少: {sorted(missing)}")
+    start = _period_start(period, end=store['dates'][-1]) if len(store['dates']) else None
+    return slice_price_store(store, sorted(tickers), start=start)
+
+def build_price_store():
+    """用 yfinance 下载 PRICE_PERIOD 长度的历史, 写入或更新价格库"""
+    tickers = collect_real_tickers()
+    if MMAP_STORE['tickers_file']:
+        with open(MMAP_STORE['tickers_file']) as f:
+            tickers |= {line.strip() for line in f if line.strip() and not line.startswith('#')}
+    print(f"正在建立价格库: {len(tickers)} 个 Ticker, 区间 {PRICE_PERIOD} ...")
+    df_close = fetch_yfinance(tickers, PRICE_PERIOD)
+    update_price_store(df_close)
+    store = open_price_store()
+    print(f"价格库已更新: {MMAP_STORE['dir']} ({len(store['dates'])} 天 × {len(store['tickers'])} 个 Ticker)")
+
+PRICE_PROVIDERS = {
+    'yfinance': fetch_yfinance,
+    'local': fetch_local_files,
+    'memory': fetch_memory,
+    'mmap': fetch_price_store,
+}
+MEMORY_PRICES = pd.DataFrame()
+
+# 合成指数结果按 (名称, 定义, 成分数据指纹) 缓存, 同一进程内重复合成直接复用
+_SYNTH_CACHE = {}
+
+def synthetic_order(synthetic_config=None):
+    """按依赖关系排列合成指数, 嵌套的成分指数排在前面"""
+    synthetic_config = SYNTHETIC_CONFIG if synthetic_config is None else synthetic_config
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f"合成指数循环引用: {name}")
+        visiting.add(name)
+        for c in synthetic_config[name]['components']:
+            if c in synthetic_config:
+                visit(c)
+        order.append(name)
+
+    for name in synthetic_config:
+        visit(name)
+    return order
+
+def rebalance_flags(index, rebalance):
+    """调仓日标记: 每个月/季度的第一个交易日, 首日总是调仓"""
+    flags = np.zeros(len(index), dtype=bool)
+    flags[:1] = True
+    if rebalance in ('monthly', 'quarterly') and len(index) > 1:
+        periods = index.to_period('M' if rebalance == 'monthly' else 'Q')
+        flags[1:] = periods[1:] != periods[:-1]
+    return flags
+
+def compute_synthetic(prices, weights, index, method='price', rebalance='none', base=100.0):
+    """合成指数计算: prices 为成分价格矩阵 (日期×成分), weights 为权重向量"""
+    prices = np.asarray(prices, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if method == 'price':
+        return prices @ weights
+
+    # return 口径: 从所有成分都有价格的第一天开始, 指数起点为 base
+    out = np.full(len(prices), np.nan)
+    valid = ~np.isnan(prices).any(axis=1)
+    if not valid.any():
+        return out
+    first = int(np.argmax(valid))
+    p = pd.DataFrame(prices[first:]).ffill().to_numpy()
+    w = weights / weights.sum()
+
+    # 每一行相对"上一个调仓日"的组合增长; 调仓日重置持仓, 等价于调整除数让指数在调仓前后连续
+    flags = rebalance_flags(index[first:], rebalance)
+    pos = np.arange(len(p))
+    anchor = np.concatenate([[0], np.maximum.accumulate(np.where(flags, pos, 0))[:-1]])
+    growth = (p / p[anchor]) @ w
+    level = np.zeros(len(p))
+    reb = np.flatnonzero(flags)
+    level[reb] = base * np.cumprod(growth[reb])
+    out[first:] = level[anchor] * growth
+    return out
+
+def synthesize_indices(df_close, synthetic_config=None):
+    """计算合成指数 (ERH), 一次性追加为新列"""
+    synthetic_config = SYNTHETIC_CONFIG if synthetic_config is None else synthetic_config
+    if df_close.empty:
+        return df_close
+    new_cols = {}
+    for synth_name in synthetic_order(synthetic_config):
+        config = synthetic_config[synth_name]
+        components = list(config['components'])
+        missing = [c for c in components if c not in df_close.columns and c not in new_cols]
+        if missing:
+            print(f"缺少成分股 {missing} 数据，无法合成 {synth_name}")
+            continue
+        # 嵌套合成时成分可能是刚算出的合成指数
+        prices = np.column_stack([new_cols[c] if c in new_cols else df_close[c].to_numpy(dtype=np.float64) for c in components])
+        key = (synth_name, json.dumps(config, sort_keys=True, ensure_ascii=False),
+               df_close.index[0], df_close.index[-1], hashlib.blake2b(prices.tobytes(), digest_size=16).hexdigest())
+        if key not in _SYNTH_CACHE:
+            print(f"正在计算合成指数: {synth_name} ...")
+            _SYNTH_CACHE[key] = compute_synthetic(
+                prices, [config['components'][c] for c in components], df_close.index,
+                config.get('method', 'price'), config.get('rebalance', 'none'), config.get('base', 100.0))
+        new_cols[synth_name] = _SYNTH_CACHE[key]
+    return df_close.assign(**new_cols)
+
+def get_data_and_synthesize(period="3y", extra_tickers=()):
+    """获取原始数据并计算合成指数"""
+    
+    # 1. 收集所有需要下载的真实 Ticker, 以及用到的合成指数
+    real_tickers, synthetics = resolve_tickers(SECTOR_CONFIG, INDICATORS, SYNTHETIC_CONFIG, RATIO_SCAN, extra_tickers)
+
+    provider = DATA_SOURCE['provider']
+    print(f"正在获取原始数据 ({provider}): {real_tickers} ...")
+    try:
+        df_close = PRICE_PROVIDERS[provider](real_tickers, period)
+    except Exception as e:
+        print(f"数据获取严重错误: {e}")
+        return pd.DataFrame()
+
+    if DATA_SOURCE['snapshot_out']:
+        save_price_snapshot(df_close, DATA_SOURCE['snapshot_out'])
+
+    # 2. 计算合成指数 (ERH)
+    return consolidate_panel(synthesize_indices(df_close, {n: SYNTHETIC_CONFIG[n] for n in synthetics}))
+
+def consolidate_panel(df_close, dtype=None):
+    """把收盘价整理成单个连续的二维数组 (可选 float32), DataFrame 只是它的零拷贝包装, 列名即 Ticker→列号索引"""
+    dtype = np.dtype(dtype or PANEL_DTYPE)
+    # pandas 按 (列×日期) 存放数据块, 分配 Fortran 顺序的 (日期×列) 数组可直接作为该数据块, 每列内存连续
+    values = np.empty(df_close.shape, dtype=dtype, order='F')
+    for j, t in enumerate(df_close.columns):
+        values[:, j] = df_close[t].to_numpy()
+    return pd.DataFrame(values, index=df_close.index, columns=df_close.columns, copy=False)
+
+# 日线面板 -> {周期: 重采样结果}; 和 series_memo 一样按面板对象缓存, 面板被回收时自动清掉,
+# 同一面板的同一周期只重采样一次, 供 RRG、指标、看板和参数扫描共用
+_RESAMPLE_CACHE = {}
+
+def resample_closes(df_close, frequency):
+    """把日线收盘价转成 D / W / M 周期: 取每个周期最后一个交易日的收盘价 (缺失先向前填充), 索引为该交易日"""
+    rule = TIMEFRAMES[frequency]['rule']
+    if rule is None or df_close.empty:
+        return df_close
+    key = id(df_close)
+    if key not in _RESAMPLE_CACHE:
+        _RESAMPLE_CACHE[key] = {}
+        weakref.finalize(df_close, _RESAMPLE_CACHE.pop, key, None)
+    cache = _RESAMPLE_CACHE[key]
+    if frequency not in cache:
+        periods = df_close.index.to_period(rule)
+        last = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+        cache[frequency] = df_close.ffill().iloc[last]
+    return cache[frequency]
+
+def rolling_mean(arr, window):
+    """沿第 0 轴 (日期) 的滚动均值, 基于累加和一次算完所有列; 与 pandas rolling(window).mean() 一致, 窗口内有 NaN 则结果为 NaN"""
+    arr = np.asarray(arr, dtype=np.float64)
+    out = np.full(arr.shape, np.nan)
+    if window > len(arr):
+        return out
+    valid = ~np.isnan(arr)
+    pad = np.zeros((1,) + arr.shape[1:])
+    csum = np.concatenate([pad, np.cumsum(np.where(valid, arr, 0.0), axis=0)])
+    ccnt = np.concatenate([pad, np.cumsum(valid, axis=0)])
+    win_sum = csum[window:] - csum[:-window]
+    win_cnt = ccnt[window:] - ccnt[:-window]
+    out[window - 1:] = np.where(win_cnt == window, win_sum / window, np.nan)
+    return out
+
+def ema_matrix(arr, span):
+    """沿第 0 轴的 EMA, 即 pandas ewm(span, adjust=False).mean(); span 可以是逐列的数组, 相同 span 的列合并成一次调用。
+    直接用 pandas 计算, 中途 NaN 的处理和增量状态 (build_stream_state) 完全一致, 不随 pandas 版本漂移"""
+    arr = np.asarray(arr, dtype=np.float64)
+    spans = np.broadcast_to(np.asarray(span, dtype=np.float64), arr.shape[1:])
+    out = np.empty(arr.shape)
+    for s in np.unique(spans):
+        cols = np.flatnonzero(spans == s)
+        out[:, cols] = pd.DataFrame(arr[:, cols]).ewm(span=s, adjust=False).mean().to_numpy()
+    return out
+
+def compute_rrg_matrix(closes, benchmarks, window_rs=60, window_mom=10):
+    """矩阵版 RRG 公式: closes 为 (日期×标的), benchmarks 为 (日期,) 或 (日期×基准)
+    一次算出所有标的的 RS / RS-Ratio / RS-Momentum; 多基准时结果形状为 (日期×基准×标的)"""
+    closes = np.asarray(closes, dtype=np.float64)
+    bench = np.asarray(benchmarks, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = closes / bench[:, None] if bench.ndim == 1 else closes[:, None, :] / bench[:, :, None]
+        ratio = 100 * (rs / rolling_mean(rs, window_rs))
+        momentum = 100 * (ratio / rolling_mean(ratio, window_mom))
+    return {'rs': rs, 'ratio': ratio, 'momentum': momentum}
+
+def compute_rrg_panel(df_close, tickers, benchmarks, window_rs=60, window_mom=10):
+    """对 DataFrame 中存在的标的/基准调用 compute_rrg_matrix, 附带日期和列名"""
+    tickers = [t for t in tickers if t in df_close.columns]
+    benchmarks = [b for b in benchmarks if b in df_close.columns]
+    res = compute_rrg_matrix(df_close[tickers].to_numpy(), df_close[benchmarks].to_numpy(), window_rs, window_mom)
+    res.update(index=df_close.index, tickers=tickers, benchmarks=benchmarks)
+    return res
+
+# 序列表达式: 比值、均线、RRG 坐标都写成嵌套元组, 相同表达式哈希相同, 同一面板上只计算一次
+#   ('col', 'XLK')                  面板中的一列 (合成指数已在 get_data_and_synthesize 中加入面板)
+#   ('ratio', a, b)                 a / b
+#   ('sma', a, 20) / ('ema', a, 20) 均线
+#   ('rel', a, b)                   100 * a / b, RS-Ratio 即 rel(rs, sma(rs, 60)), RS-Momentum 同理
+def col_expr(ticker):
+    return ('col', ticker)
+
+def ratio_expr(numerator, denominator):
+    return ('ratio', col_expr(numerator), col_expr(denominator))
+
+def rrg_exprs(ticker, benchmark, window_rs=60, window_mom=10):
+    """返回 (RS-Ratio, RS-Momentum) 两个表达式, 与 compute_rrg_matrix 同一公式"""
+    rs = ratio_expr(ticker, benchmark)
+    rs_ratio = ('rel', rs, ('sma', rs, window_rs))
+    return rs_ratio, ('rel', rs_ratio, ('sma', rs_ratio, window_mom))
+
+def _series_args(expr):
+    return [a for a in expr[1:] if isinstance(a, tuple)]
+
+def _stack_args(memo, nodes, i):
+    return np.column_stack([memo[n[i]] for n in nodes])
+
+# 每种运算接收同一层、同一参数的一组节点, 一次矩阵运算算完, 返回 (日期×节点数)
+SERIES_OPS = {
+    'col': lambda df, nodes, memo: df[[n[1] for n in nodes]].to_numpy(dtype=np.float64),
+    'ratio': lambda df, nodes, memo: _stack_args(memo, nodes, 1) / _stack_args(memo, nodes, 2),
+    'rel': lambda df, nodes, memo: 100 * (_stack_args(memo, nodes, 1) / _stack_args(memo, nodes, 2)),
+    'sma': lambda df, nodes, memo: rolling_mean(_stack_args(memo, nodes, 1), nodes[0][2]),
+    'ema': lambda df, nodes, memo: ema_matrix(_stack_args(memo, nodes, 1), np.array([n[2] for n in nodes], dtype=np.float64)),
+}
+# 参数可以逐列不同的运算: 不同窗口的 EMA 也合并进同一次递推
+SERIES_PER_COLUMN_PARAMS = {'ema'}
+
+# 面板 -> {表达式: 一维数组}; 面板被回收时自动清掉, RRG、指标、动画在同一面板上共用
+_SERIES_MEMO = {}
+
+def series_memo(df_close):
+    key = id(df_close)
+    if key not in _SERIES_MEMO:
+        _SERIES_MEMO[key] = {}
+        weakref.finalize(df_close, _SERIES_MEMO.pop, key, None)
+    return _SERIES_MEMO[key]
+
+def evaluate_series(exprs, df_close, memo=None):
+    """按拓扑顺序逐层计算表达式; 同一层中运算和参数相同的节点合并为一次矩阵运算, 已算过的直接取缓存
+    返回 {表达式: 一维数组}; 'col' 引用的 Ticker 必须在面板中"""
+    memo = series_memo(df_close) if memo is None else memo
+    depth = {}
+
+    def visit(expr):
+        if expr in memo:
+            return 0
+        if expr not in depth:
+            depth[expr] = 1 + max((visit(a) for a in _series_args(expr)), default=0)
+        return depth[expr]
+
+    for expr in exprs:
+        visit(expr)
+    levels = {}
+    for expr, d in depth.items():
+        params = () if expr[0] == 'col' or expr[0] in SERIES_PER_COLUMN_PARAMS else tuple(a for a in expr[1:] if not isinstance(a, tuple))
+        levels.setdefault(d, {}).setdefault((expr[0], params), []).append(expr)
+    for d in sorted(levels):
+        for (op, _), nodes in levels[d].items():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out = np.asfortranarray(SERIES_OPS[op](df_close, nodes, memo))
+            for j, expr in enumerate(nodes):
+                memo[expr] = out[:, j]
+    return {expr: memo[expr] for expr in exprs}
+
+def rrg_series(df_close, sectors, benchmark, window_rs=60, window_mom=10):
+    """返回 (面板中存在的板块, RS-Ratio 矩阵, RS-Momentum 矩阵), 矩阵形状为 (日期×板块)"""
+    sectors = [s for s in sectors if s in df_close.columns]
+    exprs = [rrg_exprs(s, benchmark, window_rs, window_mom) for s in sectors]
+    values = evaluate_series([e for pair in exprs for e in pair], df_close)
+    shape = (len(df_close), 0)
+    x = np.column_stack([values[ex] for ex, _ in exprs]) if exprs else np.empty(shape)
+    y = np.column_stack([values[ey] for _, ey in exprs]) if exprs else np.empty(shape)
+    return sectors, x, y
+
+def result_key(name, df_close, columns, config):
+    """内容寻址的键: 函数名 + 代码版本 + 相关配置 + 日期索引 + 用到的各列价格 (列名、dtype 和原始字节)"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{name}:{RESULT_CACHE['version']}".encode('utf-8'))
+    h.update(json.dumps(config, sort_keys=True, default=str, ensure_ascii=False).encode('utf-8'))
+    h.update(np.ascontiguousarray(df_close.index.asi8))
+    for col in columns:
+        values = np.ascontiguousarray(df_close[col].to_numpy())
+        h.update(f"{col}:{values.dtype.str}".encode('utf-8'))
+        h.update(values)
+    return f"{name}-{h.hexdigest()}"
+
+def _evict_results():
+    """缓存目录超过 max_bytes 时, 按最近使用时间 (mtime, 命中时会刷新) 从旧到新删除"""
+    entries = []
+    for entry in os.scandir(RESULT_CACHE['dir']):
+        if entry.name.endswith('.pkl'):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= RESULT_CACHE['max_bytes']:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:  # 其他进程已经删掉
+            pass
+        total -= size
+        record_metric('result_cache_evictions')
+
+def cached_result(name, df_close, columns, config, compute):
+    """纯函数结果的磁盘缓存: 输入价格切片和配置都没变时直接读取上次的结果, 否则调用 compute() 并写盘"""
+    if not RESULT_CACHE['enabled']:
+        return compute()
+    path = os.path.join(RESULT_CACHE['dir'], result_key(name, df_close, columns, config) + '.pkl')
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+            record_metric('result_cache_hits')
+            return value
+        except Exception as e:
+            print(f"结果缓存 {path} 读取失败, 重新计算: {e}")
+    value = compute()
+    record_metric('result_cache_misses')
+    os.makedirs(RESULT_CACHE['dir'], exist_ok=True)
+    # 多看板并行时几个进程可能同时写同一个键, 临时文件按进程区分
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    _evict_results()
+    return value
+
+def calculate_rrg_components(df_close, sector_config=None, window_rs=60, window_mom=10, tail=5):
+    """计算 RRG 坐标 (结果按输入内容缓存, 见 cached_result)"""
+    sector_config = sector_config or SECTOR_CONFIG
+    benchmark = sector_config['BENCHMARK']
+    # 检查数据是否存在 (ERH 已经在上一步合成进去了，所以这里能找到)
+    if benchmark not in df_close.columns:
+        return {}
+    columns = [benchmark] + [s for s in sector_config['SECTORS'] if s in df_close.columns]
+    config = {'sectors': sector_config, 'window_rs': window_rs, 'window_mom': window_mom, 'tail': tail}
+    return cached_result('rrg', df_close, columns, config,
+                         lambda: _rrg_components(df_close, sector_config, window_rs, window_mom, tail))
+
+def _rrg_components(df_close, sector_config, window_rs, window_mom, tail):
+    sectors, r_ratio, r_mom = rrg_series(df_close, sector_config['SECTORS'], sector_config['BENCHMARK'], window_rs, window_mom)
+
+    rrg_data = {}
+    for j, sec in enumerate(sectors):
+        config_val = sector_config['SECTORS'][sec]
         emoji = config_val.split(' ')[0] if ' ' in config_val else ''
         chart_label = f"{emoji} {sec}"
         display_name = f"{sec} {config_val}"
@@ -164,38 +1226,182 @@ def calculate_rrg_components(df_close):
         rrg_data[sec] = {
             'chart_label': chart_label,
             'display_name': display_name,
-            'x': r_ratio.tail(5).values,
-            'y': r_mom.tail(5).values,
-            'current_x': r_ratio.iloc[-1],
-            'current_y': r_mom.iloc[-1]
+            'x': r_ratio[-tail:, j],
+            'y': r_mom[-tail:, j],
+            'current_x': r_ratio[-1, j],
+            'current_y': r_mom[-1, j]
         }
     return rrg_data
 
+def indicator_exprs(item):
+    """指标的各列 (比值及其均线) 对应的表达式"""
+    close = ratio_expr(item['numerator'], item['denominator'])
+    cols = {'close': close}
+    for w in MA_WINDOWS:
+        cols[f'sma{w}'] = ('sma', close, w)
+        cols[f'ema{w}'] = ('ema', close, w)
+    return cols
+
 def calculate_indicators(indicators, df_close):
-    """计算常规指标"""
-    results = []
+    """计算常规指标: 所有指标的比值和均线放进同一张表达式图, 重复的序列 (包括 RRG 已算过的比值) 只算一次"""
+    items = []
     for item in indicators:
-        try:
-            # ERH 这里也可以直接被调用
-            ratio = df_close[item['numerator']] / df_close[item['denominator']]
-            df = pd.DataFrame({'close': ratio})
-            for w in [20, 60, 120]:
-                df[f'sma{w}'] = df['close'].rolling(window=w).mean()
-                df[f'ema{w}'] = df['close'].ewm(span=w, adjust=False).mean()
-            results.append({"meta": item, "df": df, "latest_value": df['close'].iloc[-1]})
-        except KeyError as e:
-            print(f"指标 {item['name']} 计算失败: 缺少数据 {e}")
-            pass
+        # ERH 这里也可以直接被调用
+        missing = [t for t in (item['numerator'], item['denominator']) if t not in df_close.columns]
+        if missing:
+            print(f"指标 {item['name']} 计算失败: 缺少数据 {', '.join(missing)}")
+            continue
+        items.append((item, indicator_exprs(item)))
+    columns = sorted({t for item, _ in items for t in (item['numerator'], item['denominator'])})
+    config = {'indicators': [item for item, _ in items], 'ma_windows': MA_WINDOWS}
+    return cached_result('indicators', df_close, columns, config, lambda: _indicator_results(items, df_close))
+
+def _indicator_results(items, df_close):
+    values = evaluate_series([e for _, cols in items for e in cols.values()], df_close)
+
+    # 所有指标 × 所有日期的均线状态一次分类完 (日期×指标×均线)
+    if items:
+        regimes = classify_ma_regime(np.column_stack([values[cols['close']] for _, cols in items]),
+                                     np.stack([np.column_stack([values[cols[c]] for c, _ in MA_COLUMNS]) for _, cols in items], axis=1))
+
+    results = []
+    for k, (item, cols) in enumerate(items):
+        df = pd.DataFrame({name: values[e] for name, e in cols.items()}, index=df_close.index)
+        regime = pd.DataFrame({key: arr[:, k] for key, arr in regimes.items()}, index=df_close.index)
+        results.append({"meta": item, "df": df, "latest_value": df['close'].iloc[-1], "regime": regime})
     return results
 
+def ratio_scan_pairs():
+    """比值扫描的全部 (分子, 分母) 对, 去重并跳过核心指标已有的"""
+    pairs = list(RATIO_SCAN['pairs'])
+    if RATIO_SCAN['sector_pairs']:
+        sectors = list(SECTOR_CONFIG['SECTORS'])
+        pairs += [(a, b) for i, a in enumerate(sectors) for b in sectors[i + 1:]]
+    core = {(item['numerator'], item['denominator']) for item in INDICATORS}
+    return [p for p in dict.fromkeys(map(tuple, pairs)) if p not in core]
+
+def rank_ratio_pairs(df_close, pairs=None):
+    """一次性计算所有比值对及其均线 (比值矩阵 + 批量 SMA/EMA), 按最新比值相对 SMA(score_window) 的偏离从强到弱排序
+    返回 DataFrame: numerator, denominator, value, score (偏离比例), support (站上的均线数)"""
+    pairs = [(a, b) for a, b in (ratio_scan_pairs() if pairs is None else pairs) if a in df_close.columns and b in df_close.columns]
+    columns = sorted({t for pair in pairs for t in pair})
+    config = {'pairs': pairs, 'score_window': RATIO_SCAN['score_window'], 'ma_windows': MA_WINDOWS}
+    return cached_result('ratio_scan', df_close, columns, config, lambda: _rank_pairs(df_close, pairs))
+
+def _rank_pairs(df_close, pairs):
+    window = RATIO_SCAN['score_window']
+    cols = [indicator_exprs({'numerator': a, 'denominator': b}) for a, b in pairs]
+    for c in cols:
+        c['score_ma'] = ('sma', c['close'], window)
+    values = evaluate_series([e for c in cols for e in c.values()], df_close)
+
+    last = {name: np.array([values[c[name]][-1] for c in cols]) for name in (cols[0] if cols else {})}
+    if not last:
+        return pd.DataFrame(columns=['numerator', 'denominator', 'value', 'score', 'support'])
+    mas = np.column_stack([last[f'{kind}{w}'] for w in MA_WINDOWS for kind in ('sma', 'ema')])
+    with np.errstate(invalid='ignore'):
+        ranking = pd.DataFrame({
+            'numerator': [a for a, _ in pairs],
+            'denominator': [b for _, b in pairs],
+            'value': last['close'],
+            'score': last['close'] / last['score_ma'] - 1,
+            'support': (last['close'][:, None] > mas).sum(axis=1),
+        }, index=[f"{a}/{b}" for a, b in pairs])
+    return ranking.sort_values('score', ascending=False, na_position='last')
+
+def select_indicators(df_close, indicators=None):
+    """核心指标固定在前, 之后附上比值扫描中最强和最弱的 top_n 个"""
+    indicators = list(INDICATORS if indicators is None else indicators)
+    if not RATIO_SCAN['enabled']:
+        return indicators
+    ranking = rank_ratio_pairs(df_close).dropna(subset=['score'])
+    n = RATIO_SCAN['top_n']
+    picks = [('强势', k, row) for k, row in enumerate(ranking.head(n).itertuples(), 1)]
+    picks += [('弱势', k, row) for k, row in enumerate(ranking.iloc[::-1].head(n).itertuples(), 1) if row.score < 0 and row.Index not in ranking.index[:n]]
+    print(f"比值扫描: {len(ranking)} 对, 选出 {len(picks)} 个")
+    for label, k, row in picks:
+        indicators.append({
+            'name': f"{label}#{k} ({row.Index})",
+            'numerator': row.numerator,
+            'denominator': row.denominator,
+            'description': f"比值扫描 {label}第{k}, 相对 SMA{RATIO_SCAN['score_window']} {row.score:+.2%}",
+            'scan_score': float(row.score),
+        })
+    return indicators
+
+def build_rrg_animation(df_close, sector_config=None, window_rs=60, window_mom=10, history=None, max_frames=None):
+    """一次性计算所有板块在历史上每个日期的 RRG 坐标, 截取最近 history 并抽帧到 max_frames 以内"""
+    sector_config = sector_config or SECTOR_CONFIG
+    max_frames = max_frames or ANIMATION_CONFIG['max_frames']
+    if sector_config['BENCHMARK'] not in df_close.columns:
+        return None
+    tickers, x, y = rrg_series(df_close, sector_config['SECTORS'], sector_config['BENCHMARK'], window_rs, window_mom)
+    index = df_close.index
+
+    # 去掉窗口预热期 (所有板块都还没有值的行), 再截取最近一段历史
+    valid = np.isfinite(x).any(axis=1) & np.isfinite(y).any(axis=1)
+    start = _period_start(history, index[-1]) if history else None
+    if start is not None:
+        valid &= index >= start
+    rows = np.flatnonzero(valid)
+    if len(rows) == 0:
+        return None
+    # 从最新一帧往前等间隔抽帧
+    step = -(-len(rows) // max_frames)
+    rows = rows[::-1][::step][::-1]
+    return {
+        'dates': list(index[rows].strftime('%Y-%m-%d')),
+        'tickers': tickers,
+        'x': x[rows].astype(np.float32),
+        'y': y[rows].astype(np.float32),
+    }
+
+def _encode_float32(arr):
+    """float32 数组按行优先编码为 base64 (小端), 页面上用 Float32Array 解码"""
+    return base64.b64encode(np.ascontiguousarray(arr, dtype='<f4').tobytes()).decode('ascii')
+
 def get_quadrant_color(x, y):
     if x > 100 and y > 100: return COLORS['leading']
     if x < 100 and y > 100: return COLORS['improving']
     if x < 100 and y < 100: return COLORS['lagging']
     return COLORS['weakening']
 
-def generate_dashboard(rrg_data, indicator_results):
-    """生成仪表盘"""
+def _add_dashboard_traces(fig, rrg_data, indicator_results, tf='D'):
+    """添加一个周期的 RRG 和指标曲线; 比值扫描选出的指标只画 RATIO_SCAN['plot_history'] 内的部分"""
+    for sec, data in rrg_data.items():
+        color = get_quadrant_color(data['current_x'], data['current_y'])
+        fig.add_trace(go.Scatter(x=data['x'], y=data['y'], mode='lines', line=dict(color='gray', width=1), opacity=0.5, showlegend=False, hoverinfo='skip'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=[data['current_x']], y=[data['current_y']], mode='markers+text', name=data['display_name'], text=data['chart_label'], textposition="top center", marker=dict(size=14, color=color, line=dict(width=1, color='black')), hovertemplate=f"<b>{data['display_name']}</b><br>RS: %{{x:.2f}}<br>Mom: %{{y:.2f}}<extra></extra>"), row=1, col=1)
+
+    for idx, res in enumerate(indicator_results):
+        row = idx + 2
+        df = plot = res['df']
+        history = RATIO_SCAN.get('plot_history', {}).get(tf) if 'scan_score' in res['meta'] else None
+        if history:
+            plot = df[df.index >= _period_start(history, df.index[-1])]
+        fig.add_trace(go.Scatter(x=plot.index, y=plot['close'], name="Ratio", line=dict(color='black', width=1.5), opacity=0.6), row=row, col=1)
+        for w in MA_WINDOWS:
+            fig.add_trace(go.Scatter(x=plot.index, y=plot[f'sma{w}'], name=f"SMA{w}", line=dict(color=COLORS[f'sma{w}'], width=1)), row=row, col=1)
+            fig.add_trace(go.Scatter(x=plot.index, y=plot[f'ema{w}'], name=f"EMA{w}", line=dict(color=COLORS[f'ema{w}'], width=1)), row=row, col=1)
+        
+        curr_idx = len(df) - 1
+        dkj_x, dkj_y = [], []
+        for lb in MA_WINDOWS:
+            target = curr_idx - lb
+            if target >= 0:
+                dkj_x.append(df.index[target])
+                dkj_y.append(df['close'].iloc[target])
+        if dkj_x:
+            fig.add_trace(go.Scatter(x=dkj_x, y=dkj_y, mode='markers', name="DKJ", marker=dict(color=COLORS['dkj'], size=8)), row=row, col=1)
+
+def generate_dashboard(rrg_data, indicator_results, output_path="index.html", timeframes=None, animations=None):
+    """生成仪表盘; timeframes 为 {周期: (rrg_data, indicator_results)} 时每个周期一组曲线, 页面上用按钮切换
+    animations 为 {周期: build_rrg_animation 的结果} 时, RRG 可以按日期播放/拖动"""
+    timeframes = timeframes or {'D': (rrg_data, indicator_results)}
+    scan_picks = [res['meta'] for res in next(iter(timeframes.values()))[1] if 'scan_score' in res['meta']]
+    if not RATIO_SCAN.get('plot'):
+        timeframes = {tf: (r, [res for res in ind if 'scan_score' not in res['meta']]) for tf, (r, ind) in timeframes.items()}
+    rrg_data, indicator_results = next(iter(timeframes.values()))
     rows = 1 + len(indicator_results)
     row_heights = [0.55] + [0.45/len(indicator_results)] * len(indicator_results) if indicator_results else [1.0]
 
@@ -219,53 +1425,233 @@ def generate_dashboard(rrg_data, indicator_results):
     for ann in annotations:
         fig.add_annotation(xref="x domain", yref="y domain", row=1, col=1, showarrow=False, **ann)
 
-    for sec, data in rrg_data.items():
-        color = get_quadrant_color(data['current_x'], data['current_y'])
-        fig.add_trace(go.Scatter(x=data['x'], y=data['y'], mode='lines', line=dict(color='gray', width=1), opacity=0.5, showlegend=False, hoverinfo='skip'), row=1, col=1)
-        fig.add_trace(go.Scatter(x=[data['current_x']], y=[data['current_y']], mode='markers+text', name=data['display_name'], text=data['chart_label'], textposition="top center", marker=dict(size=14, color=color, line=dict(width=1, color='black')), hovertemplate=f"<b>{data['display_name']}</b><br>RS: %{{x:.2f}}<br>Mom: %{{y:.2f}}<extra></extra>"), row=1, col=1)
+    trace_ranges = {}
+    for tf, (tf_rrg, tf_ind) in timeframes.items():
+        start = len(fig.data)
+        _add_dashboard_traces(fig, tf_rrg, tf_ind, tf)
+        trace_ranges[tf] = (start, len(fig.data))
 
-    for idx, res in enumerate(indicator_results):
-        row = idx + 2
-        df = res['df']
-        fig.add_trace(go.Scatter(x=df.index, y=df['close'], name="Ratio", line=dict(color='black', width=1.5), opacity=0.6), row=row, col=1)
-        for w in [20, 60, 120]:
-            fig.add_trace(go.Scatter(x=df.index, y=df[f'sma{w}'], name=f"SMA{w}", line=dict(color=COLORS[f'sma{w}'], width=1)), row=row, col=1)
-            fig.add_trace(go.Scatter(x=df.index, y=df[f'ema{w}'], name=f"EMA{w}", line=dict(color=COLORS[f'ema{w}'], width=1)), row=row, col=1)
-        
-        curr_idx = len(df) - 1
-        dkj_x, dkj_y = [], []
-        for lb in [20, 60, 120]:
-            target = curr_idx - lb
-            if target >= 0:
-                dkj_x.append(df.index[target])
-                dkj_y.append(df['close'].iloc[target])
-        if dkj_x:
-            fig.add_trace(go.Scatter(x=dkj_x, y=dkj_y, mode='markers', name="DKJ", marker=dict(color=COLORS['dkj'], size=8)), row=row, col=1)
+    # 多个周期时只显示第一个, 按钮切换各周期曲线的可见性
+    if len(timeframes) > 1:
+        first = next(iter(timeframes))
+        n = len(fig.data)
+        for tf, (start, end) in trace_ranges.items():
+            for trace in fig.data[start:end]:
+                trace.visible = tf == first
+        buttons = [dict(label=TIMEFRAMES[tf]['label'], method='update', args=[{'visible': [start <= i < end for i in range(n)]}])
+                   for tf, (start, end) in trace_ranges.items()]
+        fig.update_layout(updatemenus=[dict(type='buttons', direction='right', buttons=buttons, showactive=True,
+                                            x=1, xanchor='right', y=1.0, yanchor='bottom')])
 
-    fig.update_layout(title_text=f"量化交易员看板 ({datetime.now().strftime('%Y-%m-%d')})", width=1000, height=800 + 400 * len(indicator_results), template="plotly_white", showlegend=True)
+    title = f"{DASHBOARD_CONFIG['title']} ({datetime.now().strftime('%Y-%m-%d')})"
+    if scan_picks:
+        title += "<br><sup>比值扫描: " + " · ".join(f"{m['name']} {m['scan_score']:+.2%}" for m in scan_picks) + "</sup>"
+    fig.update_layout(title_text=title, width=1000, height=800 + 400 * len(indicator_results), template="plotly_white", showlegend=True)
     fig.update_yaxes(scaleanchor="x", scaleratio=1, row=1, col=1)
     fig.update_xaxes(constrain='domain', row=1, col=1)
-    fig.write_html("index.html")
 
-def get_ma_status_text(current_val, row):
-    mas = {'SMA20': row['sma20'], 'EMA20': row['ema20'], 'SMA60': row['sma60'], 'EMA60': row['ema60'], 'SMA120': row['sma120'], 'EMA120': row['ema120']}
-    support_count = sum(1 for v in mas.values() if current_val > v)
-    if support_count == 6: return "🚀 **超强多头** (高于所有均线)"
-    if support_count == 0: return "🩸 **极度弱势** (低于所有均线)"
-    
-    sorted_mas = sorted(mas.items(), key=lambda item: item[1])
-    floor_ma, ceil_ma = None, None
-    for name, val in sorted_mas:
-        if current_val > val: floor_ma = name
-        else:
-            ceil_ma = name
-            break
-    if floor_ma and ceil_ma: return f"⚖️ **震荡** ({floor_ma} < 现价 < {ceil_ma})"
-    return f"⚠️ **均线纠缠** (支撑: {support_count}/6)"
+    # 动画数据和周期按钮一一对应; 每个板块两条曲线: 尾迹 (start + 2j) 和当前点 (start + 2j + 1)
+    extra = None
+    if animations:
+        views = []
+        for tf, (start, _) in trace_ranges.items():
+            anim, sectors = animations.get(tf), list(timeframes[tf][0])
+            if anim is None:
+                views.append(None)
+                continue
+            cols = [j for j, t in enumerate(anim['tickers']) if t in sectors]
+            pos = [start + 2 * sectors.index(anim['tickers'][j]) for j in cols]
+            views.append({'dates': anim['dates'], 'n': len(cols),
+                          'x': _encode_float32(anim['x'][:, cols]), 'y': _encode_float32(anim['y'][:, cols]),
+                          'tail_traces': pos, 'marker_traces': [i + 1 for i in pos]})
+        extra = {'animation': {'views': views, 'tail': ANIMATION_CONFIG['tail'], 'interval': ANIMATION_CONFIG['interval_ms'],
+                               'colors': {q: COLORS[q] for q in ('leading', 'weakening', 'lagging', 'improving')}}}
+    write_dashboard_html(fig, output_path, extra)
+
+DASHBOARD_HTML = """<html>
+<head><meta charset="utf-8" />{plotlyjs}</head>
+<body>
+    <div id="dashboard"></div>
+    <script type="text/javascript">
+        function render(fig) {{
+            // 还原被去重的共享数组 (例如所有指标曲线共用的日期轴)
+            fig.data.forEach(function (t) {{
+                if (typeof t.x === "string" && t.x in fig.shared) t.x = fig.shared[t.x];
+            }});
+            Plotly.newPlot("dashboard", fig.data, fig.layout, {{responsive: true}}).then(function (gd) {{
+                if (fig.animation) setupAnimation(gd, fig.animation);
+            }});
+        }}
+        function decodeFloat32(s) {{
+            var b = atob(s), u = new Uint8Array(b.length);
+            for (var i = 0; i < b.length; i++) u[i] = b.charCodeAt(i);
+            return new Float32Array(u.buffer);
+        }}
+        // RRG 动画: 每个周期的全部帧已预先算好, 这里只按当前帧和尾迹长度切片后 restyle
+        function setupAnimation(gd, anim) {{
+            var views = anim.views.map(function (v) {{
+                return v && {{dates: v.dates, n: v.n, x: decodeFloat32(v.x), y: decodeFloat32(v.y), tail: v.tail_traces, marker: v.marker_traces}};
+            }});
+            var bar = document.createElement("div");
+            bar.style.cssText = "margin:8px 0;font-family:sans-serif;font-size:14px";
+            bar.innerHTML = '<button id="rrg-play">▶ 播放</button> <input id="rrg-frame" type="range" min="0" value="0" style="width:520px;vertical-align:middle"> '
+                + '<span id="rrg-date"></span> &nbsp;尾迹 <input id="rrg-tail" type="number" min="1" max="100" value="' + anim.tail + '" style="width:50px">';
+            gd.parentNode.insertBefore(bar, gd);
+            var play = document.getElementById("rrg-play"), slider = document.getElementById("rrg-frame"),
+                label = document.getElementById("rrg-date"), tailInput = document.getElementById("rrg-tail");
+            var view = views[0], timer = null;
+
+            function color(x, y) {{
+                if (x > 100 && y > 100) return anim.colors.leading;
+                if (x < 100 && y > 100) return anim.colors.improving;
+                if (x < 100 && y < 100) return anim.colors.lagging;
+                return anim.colors.weakening;
+            }}
+            function draw(f) {{
+                var n = view.n, lo = Math.max(0, f - Math.max(1, parseInt(tailInput.value) || 1) + 1);
+                var tx = [], ty = [], mx = [], my = [], mc = [];
+                for (var j = 0; j < n; j++) {{
+                    var px = [], py = [];
+                    for (var k = lo; k <= f; k++) {{ px.push(view.x[k * n + j]); py.push(view.y[k * n + j]); }}
+                    tx.push(px); ty.push(py);
+                    mx.push([view.x[f * n + j]]); my.push([view.y[f * n + j]]);
+                    mc.push(color(view.x[f * n + j], view.y[f * n + j]));
+                }}
+                Plotly.restyle(gd, {{x: tx, y: ty}}, view.tail);
+                Plotly.restyle(gd, {{x: mx, y: my, "marker.color": mc}}, view.marker);
+                label.textContent = view.dates[f];
+            }}
+            function stop() {{ clearInterval(timer); timer = null; play.textContent = "▶ 播放"; }}
+            function select(v) {{
+                stop();
+                view = v;
+                bar.style.display = v ? "" : "none";
+                if (!v) return;
+                slider.max = v.dates.length - 1;
+                slider.value = v.dates.length - 1;
+                label.textContent = v.dates[v.dates.length - 1];
+            }}
+            play.onclick = function () {{
+                if (timer) return stop();
+                if (+slider.value >= +slider.max) slider.value = 0;
+                play.textContent = "⏸ 暂停";
+                timer = setInterval(function () {{
+                    draw(+slider.value);
+                    if (+slider.value >= +slider.max) return stop();
+                    slider.value = +slider.value + 1;
+                }}, anim.interval);
+            }};
+            slider.oninput = function () {{ stop(); draw(+slider.value); }};
+            tailInput.onchange = function () {{ if (view) draw(+slider.value); }};
+            // 切换周期按钮时, 控件改为驱动该周期的曲线 (切换后显示的是最新一帧)
+            gd.on("plotly_buttonclicked", function (e) {{ select(views[e.active]); }});
+            select(view);
+        }}
+        {loader}
+    </script>
+</body>
+</html>
+"""
+
+def _compact_trace_arrays(fig, float32=True):
+    """日期数组改为 'YYYY-MM-DD' 字符串, 浮点数组按配置转为 float32 (plotly 会编码成 base64 typed array)"""
+    for trace in fig.data:
+        for key in ('x', 'y'):
+            arr = trace[key]
+            if not isinstance(arr, np.ndarray) or len(arr) == 0:
+                continue
+            if arr.dtype.kind in 'MUO':
+                try:
+                    dates = pd.DatetimeIndex(arr)
+                except (TypeError, ValueError):
+                    continue
+                if (dates == dates.normalize()).all():
+                    trace[key] = list(dates.strftime('%Y-%m-%d'))
+            elif arr.dtype.kind == 'f' and float32:
+                trace[key] = arr.astype(np.float32)
+
+def build_dashboard_payload(fig, float32=True, extra=None):
+    """生成紧凑的图表 JSON: 重复出现的长 x 数组只保存一份, trace 中以 key 引用; extra 合并到顶层 (如动画数据)"""
+    _compact_trace_arrays(fig, float32)
+    fig_json = json.loads(fig.to_json())
+    shared, keys = {}, {}
+    for trace in fig_json['data']:
+        x = trace.get('x')
+        if isinstance(x, list) and len(x) >= 20:
+            key = keys.setdefault(tuple(x), f"x{len(keys)}")
+            shared[key] = x
+            trace['x'] = key
+    fig_json['shared'] = shared
+    fig_json.update(extra or {})
+    return json.dumps(fig_json, separators=(',', ':'), ensure_ascii=False)
 
-def send_telegram(rrg_data, indicator_results):
-    if not TG_BOT_TOKEN or not TG_CHAT_ID: return
+def write_dashboard_html(fig, output_path="index.html", extra=None):
+    """输出轻量 html: plotly.js 只引用一次, 图表数据为紧凑 JSON"""
+    mode = DASHBOARD_CONFIG['plotlyjs']
+    if mode == 'cdn':
+        plotlyjs = f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js" charset="utf-8"></script>'
+    elif mode == 'inline':
+        plotlyjs = f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    else:
+        plotlyjs = f'<script src="{mode}" charset="utf-8"></script>'
 
+    payload = build_dashboard_payload(fig, DASHBOARD_CONFIG['float32'], extra)
+    if DASHBOARD_CONFIG['payload'] == 'external':
+        json_path = os.path.splitext(output_path)[0] + '.json'
+        with open(json_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        loader = f'fetch("{os.path.basename(json_path)}").then(function (r) {{ return r.json(); }}).then(render);'
+    else:
+        loader = f'render({payload});'
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(DASHBOARD_HTML.format(plotlyjs=plotlyjs, loader=loader))
+    print(f"看板已生成: {output_path} ({os.path.getsize(output_path) / 1024:.1f} KB)")
+
+# 六条均线的 (列名, 显示名), 顺序即 floor/ceil 编号; 状态编码见 REGIME_LABELS
+MA_COLUMNS = [(f'{kind}{w}', f'{kind.upper()}{w}') for w in MA_WINDOWS for kind in ('sma', 'ema')]
+REGIME_LABELS = {0: '极度弱势', 1: '均线纠缠', 2: '震荡', 3: '超强多头'}
+
+def classify_ma_regime(close, mas):
+    """向量化的均线状态分类: close 形状 (...), mas 形状 (..., 均线数), 可以是所有指标 × 所有日期
+    support: 现价站上的均线数; floor / ceil: 现价下方最近 / 上方最近的均线编号 (没有为 -1); regime: 状态编码"""
+    close = np.asarray(close, dtype=np.float64)[..., None]
+    mas = np.asarray(mas, dtype=np.float64)
+    below, above = mas < close, mas >= close  # NaN 两边都不算
+    support = below.sum(axis=-1)
+    floor = np.where(below.any(axis=-1), np.argmax(np.where(below, mas, -np.inf), axis=-1), -1)
+    ceil = np.where(above.any(axis=-1), np.argmin(np.where(above, mas, np.inf), axis=-1), -1)
+    regime = np.select([support == mas.shape[-1], support == 0, (floor >= 0) & (ceil >= 0)], [3, 0, 2], default=1)
+    return {'support': support, 'floor': floor, 'ceil': ceil, 'regime': regime}
+
+def regime_stats(regime):
+    """一条状态序列的统计: 当前状态及已持续的周期数, 各状态占比和平均持续周期数"""
+    regime = np.asarray(regime)
+    if len(regime) == 0:
+        return {}
+    starts = np.flatnonzero(np.append(True, regime[1:] != regime[:-1]))
+    lengths = np.diff(np.append(starts, len(regime)))
+    codes = regime[starts]
+    return {
+        'current': REGIME_LABELS[int(regime[-1])],
+        'current_run': int(lengths[-1]),
+        'share': {label: float((regime == c).mean()) for c, label in REGIME_LABELS.items()},
+        'avg_run': {label: float(lengths[codes == c].mean()) for c, label in REGIME_LABELS.items() if (codes == c).any()},
+    }
+
+def format_ma_status(support, floor, ceil, regime):
+    """把 classify_ma_regime 的一个结果格式化为推送文字"""
+    if regime == 3: return "🚀 **超强多头** (高于所有均线)"
+    if regime == 0: return "🩸 **极度弱势** (低于所有均线)"
+    if regime == 2: return f"⚖️ **震荡** ({MA_COLUMNS[floor][1]} < 现价 < {MA_COLUMNS[ceil][1]})"
+    return f"⚠️ **均线纠缠** (支撑: {support}/{len(MA_COLUMNS)})"
+
+def get_ma_status_text(current_val, row):
+    r = classify_ma_regime(current_val, [row[col] for col, _ in MA_COLUMNS])
+    return format_ma_status(int(r['support']), int(r['floor']), int(r['ceil']), int(r['regime']))
+
+def build_telegram_message(rrg_data, indicator_results):
+    """组装 Telegram 推送文本"""
     leading = [d['display_name'] for d in rrg_data.values() if d['current_x']>100 and d['current_y']>100]
     improving = [d['display_name'] for d in rrg_data.values() if d['current_x']<100 and d['current_y']>100]
     
@@ -278,26 +1664,830 @@ def send_telegram(rrg_data, indicator_results):
     lines.append("\n" + "-"*15)
     
     for res in indicator_results:
-        last_row = res['df'].iloc[-1]
         curr_val = res['latest_value']
-        status_text = get_ma_status_text(curr_val, last_row)
+        last = res['regime'].iloc[-1]
+        status_text = format_ma_status(int(last['support']), int(last['floor']), int(last['ceil']), int(last['regime']))
+        stats = regime_stats(res['regime']['regime'].to_numpy())
         lines.append(f"📊 **{res['meta']['name']}**")
         lines.append(f"现值: `{curr_val:.4f}`")
-        lines.append(f"状态: {status_text}")
+        lines.append(f"状态: {status_text} (已持续 {stats['current_run']} 个交易日)")
+        if 'scan_score' in res['meta']:
+            lines.append(f"扫描: {res['meta']['description']}")
         lines.append("")
 
     lines.append(f"🔗 [查看可视化报表]({url})")
-    requests.post(f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage", json={"chat_id": TG_CHAT_ID, "text": "\n".join(lines), "parse_mode": "Markdown"})
+    return "\n".join(lines)
+
+def split_message(text, limit=4096):
+    """按行把长消息切成不超过 limit 个字符的片段, 单行过长时硬切"""
+    chunks, current = [], ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def _post_telegram(session, semaphore, chat_id, text):
+    """发送一条消息; 429 按 retry_after 等待, 5xx 和网络错误指数退避, 其他 4xx 直接放弃"""
+    url = f"{TELEGRAM_CONFIG['api_base']}/bot{TG_BOT_TOKEN}/sendMessage"
+    payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
+    for attempt in range(TELEGRAM_CONFIG['max_retries'] + 1):
+        if attempt:
+            record_metric('telegram_retries')
+        try:
+            async with semaphore, session.post(url, json=payload) as resp:
+                body = await resp.read()
+                record_metric('telegram_requests')
+                record_metric('telegram_bytes', len(body))
+                if resp.status == 200:
+                    return True
+                if resp.status == 429:
+                    try:
+                        wait = json.loads(body)['parameters']['retry_after']
+                    except (ValueError, KeyError, TypeError):
+                        wait = float(resp.headers.get('Retry-After', 2 ** attempt))
+                elif resp.status >= 500:
+                    wait = 2 ** attempt
+                else:
+                    print(f"Telegram 推送到 {chat_id} 失败: HTTP {resp.status} {body[:200]!r}")
+                    return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            wait = 2 ** attempt
+            print(f"Telegram 推送到 {chat_id} 网络错误: {e!r}")
+        await asyncio.sleep(wait)
+    print(f"Telegram 推送到 {chat_id} 重试 {TELEGRAM_CONFIG['max_retries']} 次后仍失败")
+    return False
+
+async def deliver_telegram(text, chat_ids):
+    """共用一个连接池, 并发推送到多个会话; 同一会话内的分片按顺序、按间隔发送"""
+    chunks = split_message(text, TELEGRAM_CONFIG['chunk_size'])
+    semaphore = asyncio.Semaphore(TELEGRAM_CONFIG['max_concurrency'])
+    connector = aiohttp.TCPConnector(limit=TELEGRAM_CONFIG['max_concurrency'])
+    timeout = aiohttp.ClientTimeout(total=TELEGRAM_CONFIG['timeout'])
+
+    async def send_chat(session, chat_id):
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(TELEGRAM_CONFIG['per_chat_interval'])
+            if not await _post_telegram(session, semaphore, chat_id, chunk):
+                return False
+        return True
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        results = await asyncio.gather(*(send_chat(session, c) for c in chat_ids))
+    return dict(zip(chat_ids, results))
+
+def send_telegram(rrg_data, indicator_results, events=None, on_sent=None):
+    """在后台线程里异步推送, 立即返回线程对象 (未配置或没有要发的内容时返回 None), 不阻塞后续计算
+    传入 events 时按 EVENTS_CONFIG['telegram'] 决定发事件提醒、全量摘要还是两者都发; 所有会话都发送成功后调用 on_sent()"""
+    if not TG_BOT_TOKEN or not TG_CHAT_ID: return None
+    mode = 'summary' if events is None else EVENTS_CONFIG['telegram']
+    parts = []
+    if mode in ('summary', 'both'):
+        parts.append(build_telegram_message(rrg_data, indicator_results))
+    if mode in ('events', 'both') and events:
+        parts.append(build_event_message(events))
+    if not parts:
+        print("没有新事件, 跳过 Telegram 推送")
+        return None
+    text = "\n\n".join(parts)
+    chat_ids = [c.strip() for c in TG_CHAT_ID.split(',') if c.strip()]
+
+    def run():
+        results = asyncio.run(deliver_telegram(text, chat_ids))
+        failed = [c for c, ok in results.items() if not ok]
+        record_metric('telegram_failed_chats', len(failed))
+        print(f"Telegram 推送完成: {len(results) - len(failed)}/{len(results)} 个会话成功")
+        if not failed and on_sent is not None:
+            on_sent()
+
+    thread = threading.Thread(target=run, name="telegram", daemon=True)
+    thread.start()
+    return thread
+
+# ================= 事件提醒 =================
+
+def _transitions(state, valid):
+    """state 为 (日期×序列) 的离散状态矩阵; 前后两天都有效且状态不同的位置为 True"""
+    changed = np.zeros(state.shape, dtype=bool)
+    changed[1:] = (state[1:] != state[:-1]) & valid[1:] & valid[:-1]
+    return changed
+
+def _shift_rows(arr, n):
+    out = np.full(arr.shape, np.nan)
+    if n < len(arr):
+        out[n:] = arr[:len(arr) - n]
+    return out
+
+def event_series(indicators=None):
+    """需要监控的比值: 核心指标 + 比值扫描的全部组合, 返回 [(名称, 分子, 分母)]"""
+    indicators = INDICATORS if indicators is None else indicators
+    series = {(i['numerator'], i['denominator']): i['name'] for i in indicators}
+    if RATIO_SCAN['enabled']:
+        for a, b in ratio_scan_pairs():
+            series.setdefault((a, b), f"{a}/{b}")
+    return [(name, a, b) for (a, b), name in series.items()]
+
+def detect_events(df_close, since_row=0, indicators=None, sector_config=None, window_rs=60, window_mom=10):
+    """在 (日期×序列) 矩阵上一次性找出所有状态切换, 只返回第 since_row 行及之后的事件
+    每个事件为 {'date', 'kind', 'series', 'text'}"""
+    sector_config = sector_config or SECTOR_CONFIG
+    index, events = df_close.index, []
+
+    def collect(changed, kind, names, describe):
+        rows, cols = np.nonzero(changed[since_row:])
+        for t, j in sorted(zip(rows + since_row, cols)):
+            events.append({'date': index[t].strftime('%Y-%m-%d'), 'kind': kind, 'series': names[j], 'text': describe(t, j)})
+
+    # 象限切换
+    if sector_config['BENCHMARK'] in df_close.columns:
+        sectors, x, y = rrg_series(df_close, sector_config['SECTORS'], sector_config['BENCHMARK'], window_rs, window_mom)
+        codes = classify_quadrants(x, y)
+        quad_names = {code: QUADRANT_NAMES[q] for q, code in QUADRANT_CODES.items()}
+        labels = [f"{s} {sector_config['SECTORS'][s]}" for s in sectors]
+        collect(_transitions(codes, codes >= 0), 'quadrant', labels,
+                lambda t, j: f"{labels[j]}: {quad_names[codes[t - 1, j]]} → {quad_names[codes[t, j]]}")
+
+    # 比值类事件: 所有比值和均线经表达式图批量计算
+    series = [(n, a, b) for n, a, b in event_series(indicators) if a in df_close.columns and b in df_close.columns]
+    if not series:
+        return events
+    names = [n for n, _, _ in series]
+    closes = [ratio_expr(a, b) for _, a, b in series]
+    mas = {col: [(col[:3], e, int(col[3:])) for e in closes] for col in EVENTS_CONFIG['cross_mas']}
+    values = evaluate_series(closes + [e for exprs in mas.values() for e in exprs], df_close)
+    close = np.column_stack([values[e] for e in closes])
+    finite = np.isfinite(close)
+
+    for col, exprs in mas.items():
+        ma = np.column_stack([values[e] for e in exprs])
+        above = close > ma
+        label = dict(MA_COLUMNS)[col]
+        collect(_transitions(above, finite & np.isfinite(ma)), 'ma_cross', names,
+                lambda t, j, above=above, label=label: f"{names[j]} {'上穿' if above[t, j] else '跌破'} {label}")
+
+    for w in EVENTS_CONFIG['high_windows']:
+        frame = pd.DataFrame(close)
+        prev_max = frame.rolling(w).max().shift(1).to_numpy()
+        prev_min = frame.rolling(w).min().shift(1).to_numpy()
+        for kind, flag, word in (('high', close > prev_max, '新高'), ('low', close < prev_min, '新低')):
+            # 只在刚创出新高/新低的第一天提醒
+            valid = finite & np.isfinite(prev_max)
+            changed = _transitions(flag, valid) & flag
+            collect(changed, kind, names, lambda t, j, w=w, word=word: f"{names[j]} 创 {w} 日{word} ({close[t, j]:.4f})")
+
+    if EVENTS_CONFIG['dkj']:
+        for lb in MA_WINDOWS:
+            ref = _shift_rows(close, lb)
+            above = close > ref
+            collect(_transitions(above, finite & np.isfinite(ref)), 'dkj', names,
+                    lambda t, j, lb=lb, above=above: f"{names[j]} {'上穿' if above[t, j] else '跌破'} {lb} 日抵扣价")
+    return events
+
+def load_event_state(path=None):
+    path = path or EVENTS_CONFIG['state_path']
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"事件状态 {path} 读取失败, 只提醒最新一天: {e}")
+        return None
+
+def save_event_state(state, path=None):
+    path = path or EVENTS_CONFIG['state_path']
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
 
-def main():
-    # 改为调用新的包含合成逻辑的数据获取函数
-    df_all = get_data_and_synthesize() 
+def scan_new_events(df_close, indicators=None, state=None):
+    """只扫描上次处理日期之后的交易日 (最多补报 max_catchup 天), 返回 (新事件, 新状态); 新状态在推送成功后再保存"""
+    state = load_event_state() if state is None else state
+    n = len(df_close)
+    since_row = n - 1
+    if state and state.get('last_date'):
+        after = int(df_close.index.searchsorted(pd.Timestamp(state['last_date']), side='right'))
+        since_row = max(after, n - EVENTS_CONFIG['max_catchup'])
+    events = detect_events(df_close, since_row, indicators) if since_row < n else []
+    return events, {'last_date': df_close.index[-1].strftime('%Y-%m-%d'), 'last_events': len(events)}
+
+EVENT_TITLES = {'quadrant': '🧭 象限切换', 'ma_cross': '📈 均线突破', 'high': '🏔️ 新高', 'low': '🕳️ 新低', 'dkj': '🎯 抵扣价突破'}
+
+def build_event_message(events):
+    """按事件类型分组的提醒文本"""
+    dates = sorted({e['date'] for e in events})
+    lines = [f"🔔 **{dates[-1]} 新信号** ({len(events)} 条)"]
+    for kind, title in EVENT_TITLES.items():
+        group = [e for e in events if e['kind'] == kind]
+        if not group:
+            continue
+        lines.append(f"\n{title}:")
+        limit = EVENTS_CONFIG['max_per_kind']
+        lines += [f"  {e['text']}" + (f" ({e['date']})" if len(dates) > 1 else "") for e in group[:limit]]
+        if len(group) > limit:
+            lines.append(f"  ... 另有 {len(group) - limit} 条")
+    return "\n".join(lines)
+
+# ================= 增量计算 =================
+# 用环形缓冲保存滚动窗口内的值和窗口和, EMA 只保存上一期的值,
+# 每来一根新 K 线只做 O(1) 的加减, 不再回头重算整段历史。
+
+def _ring_new(history, window):
+    """用历史序列 (日期×列) 的最后 window 行初始化环形缓冲, pos 指向最旧的一行"""
+    buf = np.array(history[-window:], dtype=np.float64)
+    return {'buf': buf, 'sum': buf.sum(axis=0), 'pos': 0, 'window': window}
+
+def _ring_peek(ring, value):
+    """假设 value 入窗后的窗口均值 (不修改缓冲)"""
+    return (ring['sum'] - ring['buf'][ring['pos']] + value) / ring['window']
+
+def _ring_push(ring, value):
+    ring['sum'] = ring['sum'] - ring['buf'][ring['pos']] + value
+    ring['buf'][ring['pos']] = value
+    ring['pos'] = (ring['pos'] + 1) % ring['window']
+    # 每转一圈用缓冲重算一次窗口和, 消除浮点累积误差, 也让 NaN 能自然滚出窗口
+    if ring['pos'] == 0:
+        ring['sum'] = ring['buf'].sum(axis=0)
+
+def _stream_config_key(sector_config, indicators, window_rs, window_mom):
+    return (sector_config['BENCHMARK'], tuple(sector_config['SECTORS']), json.dumps(SYNTHETIC_CONFIG, sort_keys=True),
+            tuple((i['numerator'], i['denominator']) for i in indicators), window_rs, window_mom, tuple(MA_WINDOWS))
+
+def _rebalance_period(date, rebalance):
+    return pd.Period(date, 'M' if rebalance == 'monthly' else 'Q') if rebalance in ('monthly', 'quarterly') else None
+
+def synthetic_anchors(df_close):
+    """return 口径合成指数最近一次调仓时的成分价格和指数点位, 单根 K 线据此 O(1) 算出指数"""
+    anchors = {}
+    for synth_name in synthetic_order():
+        config = SYNTHETIC_CONFIG[synth_name]
+        if config.get('method', 'price') != 'return' or synth_name not in df_close.columns:
+            continue
+        sub = df_close[[synth_name, *config['components']]].dropna()
+        if sub.empty:
+            continue
+        r = np.flatnonzero(rebalance_flags(sub.index, config.get('rebalance', 'none')))[-1]
+        anchors[synth_name] = {'prices': sub.iloc[r][list(config['components'])].to_dict(), 'level': sub[synth_name].iloc[r],
+                               'period': _rebalance_period(sub.index[r], config.get('rebalance'))}
+    return anchors
+
+def roll_synthetic_anchors(anchors, prices, date):
+    """提交收盘 K 线时, 如果进入了新的调仓周期, 以当日收盘重置锚点 (即调仓)"""
+    for synth_name, anchor in anchors.items():
+        config = SYNTHETIC_CONFIG[synth_name]
+        period = _rebalance_period(date, config.get('rebalance'))
+        if period is not None and period != anchor['period'] and synth_name in prices:
+            anchors[synth_name] = {'prices': {c: prices[c] for c in config['components']}, 'level': prices[synth_name], 'period': period}
+
+def synthesize_bar(prices, anchors=None):
+    """对单根 K 线 (ticker -> 价格) 计算合成指数, 口径与 synthesize_indices 一致"""
+    prices, anchors = dict(prices), anchors or {}
+    for synth_name in synthetic_order():
+        components = SYNTHETIC_CONFIG[synth_name]['components']
+        if not all(t in prices for t in components):
+            continue
+        if SYNTHETIC_CONFIG[synth_name].get('method', 'price') == 'price':
+            prices[synth_name] = sum(prices[t] * w for t, w in components.items())
+        elif synth_name in anchors:
+            anchor = anchors[synth_name]
+            growth = sum(prices[t] / anchor['prices'][t] * w for t, w in components.items()) / sum(components.values())
+            prices[synth_name] = anchor['level'] * growth
+    return prices
+
+def build_stream_state(df_close, sector_config=None, indicators=None, window_rs=60, window_mom=10, tail=5):
+    """用历史收盘价 (已含合成指数) 初始化增量状态"""
+    sector_config = sector_config or SECTOR_CONFIG
+    indicators = INDICATORS if indicators is None else indicators
+    df_close = df_close.ffill()
+    benchmark = sector_config['BENCHMARK']
+    sectors = [s for s in sector_config['SECTORS'] if s in df_close.columns]
+    indicators = [i for i in indicators if i['numerator'] in df_close.columns and i['denominator'] in df_close.columns]
+
+    res = compute_rrg_panel(df_close, sectors, [benchmark], window_rs, window_mom)
+    ratios = (df_close[[i['numerator'] for i in indicators]].to_numpy()
+              / df_close[[i['denominator'] for i in indicators]].to_numpy())
+    emas = {w: pd.DataFrame(ratios).ewm(span=w, adjust=False).mean().iloc[-1].to_numpy() for w in MA_WINDOWS}
+
+    return {
+        'config': _stream_config_key(sector_config, indicators, window_rs, window_mom),
+        'date': df_close.index[-1],
+        'last_close': df_close.iloc[-1].dropna().to_dict(),
+        'synth_anchors': synthetic_anchors(df_close),
+        'sector_config': sector_config, 'sectors': sectors, 'indicators': indicators,
+        'rs': _ring_new(res['rs'][:, 0, :], window_rs),
+        'ratio': _ring_new(res['ratio'][:, 0, :], window_mom),
+        'tail_x': res['ratio'][-tail:, 0, :].copy(), 'tail_y': res['momentum'][-tail:, 0, :].copy(),
+        'ind_sma': {w: _ring_new(ratios, w) for w in MA_WINDOWS},
+        'ind_ema': emas,
+    }
+
+def update_stream_state(state, prices, date=None, commit=True):
+    """用一根新 K 线 (ticker -> 价格) 推进状态并返回最新快照
+    commit=False 时只试算、不修改状态, 用于盘中尚未收盘的临时 K 线"""
+    px = synthesize_bar({**state['last_close'], **prices}, state['synth_anchors'])
+    sectors, inds = state['sectors'], state['indicators']
+    bench = state['sector_config']['BENCHMARK']
+
+    # RRG: 与 compute_rrg_matrix 同一公式, 只是窗口均值换成环形缓冲
+    rs = np.array([px[s] for s in sectors]) / px[bench]
+    ratio = 100 * (rs / _ring_peek(state['rs'], rs))
+    mom = 100 * (ratio / _ring_peek(state['ratio'], ratio))
+
+    # 指标比值及其 SMA / EMA
+    ind = np.array([px[i['numerator']] / px[i['denominator']] for i in inds])
+    sma = {w: _ring_peek(state['ind_sma'][w], ind) for w in MA_WINDOWS}
+    ema = {w: ind * 2 / (w + 1) + state['ind_ema'][w] * (1 - 2 / (w + 1)) for w in MA_WINDOWS}
+
+    tail_x = np.vstack([state['tail_x'][1:], ratio])
+    tail_y = np.vstack([state['tail_y'][1:], mom])
+    if commit:
+        _ring_push(state['rs'], rs)
+        _ring_push(state['ratio'], ratio)
+        for w in MA_WINDOWS:
+            _ring_push(state['ind_sma'][w], ind)
+        state['ind_ema'] = ema
+        state['tail_x'], state['tail_y'] = tail_x, tail_y
+        state['last_close'] = px
+        if date is not None:
+            roll_synthetic_anchors(state['synth_anchors'], px, date)
+        state['date'] = date if date is not None else state['date']
+
+    rrg_data = {}
+    for j, sec in enumerate(sectors):
+        config_val = state['sector_config']['SECTORS'][sec]
+        emoji = config_val.split(' ')[0] if ' ' in config_val else ''
+        rrg_data[sec] = {
+            'chart_label': f"{emoji} {sec}", 'display_name': f"{sec} {config_val}",
+            'x': tail_x[:, j], 'y': tail_y[:, j], 'current_x': ratio[j], 'current_y': mom[j],
+        }
+    indicator_rows = {}
+    for k, item in enumerate(inds):
+        row = {'close': ind[k]}
+        for w in MA_WINDOWS:
+            row[f'sma{w}'], row[f'ema{w}'] = sma[w][k], ema[w][k]
+        indicator_rows[item['name']] = row
+    return {'date': date, 'rrg': rrg_data, 'indicators': indicator_rows}
+
+def advance_stream_state(state, df_close):
+    """把 df_close 中晚于状态日期的收盘 K 线逐根提交, 返回最后一个快照"""
+    snapshot = None
+    new_rows = df_close[df_close.index > state['date']]
+    for date, row in zip(new_rows.index, new_rows.to_dict('records')):
+        snapshot = update_stream_state(state, {t: v for t, v in row.items() if pd.notna(v)}, date)
+    return snapshot
+
+def save_stream_state(state, path=None):
+    path = path or STREAM_STATE_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(state, f)
+
+def load_stream_state(path=None):
+    path = path or STREAM_STATE_PATH
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"增量状态 {path} 读取失败, 将重新初始化: {e}")
+        return None
+
+def refresh_stream_state(df_close, sector_config=None, indicators=None, window_rs=60, window_mom=10):
+    """读取持久化的增量状态并推进到 df_close 的最后一天; 配置变化、状态缺失或复权价被调整时从历史重建"""
+    sector_config = sector_config or SECTOR_CONFIG
+    indicators = INDICATORS if indicators is None else indicators
+    state = load_stream_state()
+    if state is not None:
+        avail = [i for i in indicators if i['numerator'] in df_close.columns and i['denominator'] in df_close.columns]
+        if state['config'] != _stream_config_key(sector_config, avail, window_rs, window_mom) or state['date'] not in df_close.index:
+            state = None
+        # 分红/拆股会整体改写之前的复权收盘价, 状态里的环形缓冲和 EMA 还停留在旧的尺度上;
+        # 只比较真实 Ticker, 合成指数的点位取决于面板起点, 本来就会随 period 窗口移动
+        elif history_adjusted(pd.Series({t: v for t, v in state['last_close'].items() if t not in SYNTHETIC_CONFIG}),
+                              df_close.loc[state['date']]):
+            print(f"{state['date'].date()} 的收盘价与增量状态不一致 (复权价已调整), 从历史重建")
+            state = None
+    if state is None:
+        state = build_stream_state(df_close, sector_config, indicators, window_rs, window_mom)
+    else:
+        advance_stream_state(state, df_close)
+    save_stream_state(state)
+    return state
+
+# ================= 盘中模式 =================
+# 在 asyncio 事件循环里消费 K 线流: 生产者把 K 线放进有界队列, 消费者在增量状态上试算当前 K 线。
+# 同一交易日内的 K 线只试算不提交, 出现下一个交易日的 K 线时才把上一日最后的价格作为收盘提交,
+# 因此内存只占用固定大小的环形缓冲和队列。
+
+QUADRANT_NAMES = {'leading': '领先', 'improving': '改善', 'lagging': '落后', 'weakening': '衰退'}
+
+async def replay_bar_source(path, interval=0.0):
+    """K 线源: 逐行回放本地 CSV (timestamp,ticker,close), 同一时间戳的行聚合成一根 K 线"""
+    with open(path, newline='') as f:
+        current_ts, prices = None, {}
+        for row in csv.DictReader(f):
+            ts = pd.Timestamp(row['timestamp'])
+            if current_ts is not None and ts != current_ts:
+                yield current_ts, prices
+                prices = {}
+                await asyncio.sleep(interval)
+            current_ts = ts
+            prices[row['ticker']] = float(row['close'])
+        if current_ts is not None:
+            yield current_ts, prices
+
+BAR_SOURCES = {
+    'replay': lambda: replay_bar_source(STREAM_CONFIG['replay_path'], STREAM_CONFIG['replay_interval']),
+}
+
+def print_stream_update(snapshot):
+    """默认的更新回调: 打印每个板块所在象限和指标状态"""
+    quad_names = {code: QUADRANT_NAMES[q] for q, code in QUADRANT_CODES.items()}
+    rrg = list(snapshot['rrg'].values())
+    codes = classify_quadrants([d['current_x'] for d in rrg], [d['current_y'] for d in rrg])
+    quads = {}
+    for d, code in zip(rrg, codes):
+        quads.setdefault(quad_names.get(code, '无数据'), []).append(d['chart_label'])
+    print(f"[{snapshot['date']}] " + " | ".join(f"{q}: {' '.join(v)}" for q, v in quads.items()))
+    for name, row in snapshot['indicators'].items():
+        print(f"    {name}: {row['close']:.4f} {get_ma_status_text(row['close'], row)}")
+
+async def run_stream(state, source, on_update=print_stream_update, queue_size=1000):
+    """消费 K 线流, 每根 K 线推送一次最新的 RRG 坐标和指标比值"""
+    queue = asyncio.Queue(maxsize=queue_size)
+
+    async def produce():
+        async for bar in source:
+            await queue.put(bar)
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    session, session_prices = None, {}
+    while (bar := await queue.get()) is not None:
+        ts, prices = bar
+        # 带时区的时间戳先换成交易所时区, 再按当地日期归到交易日 (不带时区的视为交易所时间)
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert(RUN_STATE_CONFIG['market_tz']).tz_localize(None)
+        day = ts.normalize()
+        if day <= state['date']:
+            continue  # 已经以收盘价提交过的交易日
+        if session is not None and day > session:
+            update_stream_state(state, session_prices, session, commit=True)
+            session_prices = {}
+        session = day
+        session_prices.update(prices)
+        on_update(update_stream_state(state, session_prices, ts, commit=False))
+    await producer
+    return state
+
+def run_intraday():
+    """盘中模式入口: 在日线增量状态基础上消费 K 线流"""
+    # 经 refresh_stream_state 校验持久化状态: 板块、指标、合成指数或看板配置变了就从历史重建, 落后的交易日先补齐
+    # (有磁盘缓存时只下载缺失的日期)
+    df_all = get_data_and_synthesize()
     if df_all.empty: return
+    state = refresh_stream_state(df_all)
+    print(f"盘中模式启动, 状态日期 {state['date'].date()}, K 线源: {STREAM_CONFIG['source']}")
+    # 盘中价格提交出的"收盘"只留在内存里, 不回写持久化状态, 以免污染日线任务的数据
+    asyncio.run(run_stream(state, BAR_SOURCES[STREAM_CONFIG['source']](), queue_size=STREAM_CONFIG['queue_size']))
+
+# ================= 参数扫描 =================
+# 父进程把每个周期的价格矩阵放进共享内存, 工作进程只按名字挂载, 不经过 pickle 传 DataFrame;
+# 每个任务是一个 (周期, RS 窗口, 动量窗口) 组合, 所有基准和标的在一次矩阵运算里算完。
+
+_BATCH_PANELS = {}
+
+def _share_array(arr):
+    """复制到共享内存, 保留原数组的内存顺序 (整合后的面板是 Fortran 顺序, 每列连续)"""
+    order = 'F' if arr.flags.f_contiguous and not arr.flags.c_contiguous else 'C'
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, order=order)[:] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str, order)
+
+def _attach_shared(spec):
+    name, shape, dtype, order = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf, order=order)
+
+def _attach_batch_panels(specs):
+    """工作进程初始化: 挂载共享内存中的价格矩阵"""
+    for freq, spec in specs.items():
+        _BATCH_PANELS[freq] = _attach_shared(spec)
+
+def _batch_task(freq, n_tickers, window_rs, window_mom):
+    """单个组合: 前 n_tickers 列为标的, 其余列为基准; 返回最后一期的 (基准×标的) 坐标"""
+    panel = _BATCH_PANELS[freq][1]
+    res = compute_rrg_matrix(panel[:, :n_tickers], panel[:, n_tickers:], window_rs, window_mom)
+    return freq, window_rs, window_mom, res['ratio'][-1], res['momentum'][-1]
+
+def run_batch(grid=None):
+    """参数扫描入口"""
+    grid = grid or BATCH_GRID
+    tickers = list(grid['tickers'] or SECTOR_CONFIG['SECTORS'])
+    df_all = get_data_and_synthesize(grid['period'], extra_tickers=tickers + grid['benchmarks'])
+    if df_all.empty: return
+    tickers = [t for t in tickers if t in df_all.columns and t not in grid['benchmarks']]
+    benchmarks = [b for b in grid['benchmarks'] if b in df_all.columns]
+    cols = tickers + benchmarks
+
+    shms, specs = [], {}
+    for freq in grid['frequency']:
+        shm, specs[freq] = _share_array(resample_closes(df_all[cols], freq).to_numpy(dtype=np.float64))
+        shms.append(shm)
+
+    combos = [(f, rs, mom) for f in grid['frequency'] for rs in grid['window_rs'] for mom in grid['window_mom']]
+    print(f"参数扫描: {len(combos)} 个组合 × {len(benchmarks)} 个基准 × {len(tickers)} 个标的 ...")
+    quad_names = {code: QUADRANT_NAMES[q] for q, code in QUADRANT_CODES.items()}
+    rows = []
+    try:
+        with ProcessPoolExecutor(max_workers=grid['workers'], initializer=_attach_batch_panels, initargs=(specs,)) as pool:
+            futures = [pool.submit(_batch_task, f, len(tickers), rs, mom) for f, rs, mom in combos]
+            for fut in as_completed(futures):
+                freq, window_rs, window_mom, ratio, mom = fut.result()
+                codes = classify_quadrants(ratio, mom)
+                for b, bench in enumerate(benchmarks):
+                    for j, t in enumerate(tickers):
+                        rows.append({'frequency': freq, 'benchmark': bench, 'window_rs': window_rs, 'window_mom': window_mom,
+                                     'ticker': t, 'rs_ratio': ratio[b, j], 'rs_momentum': mom[b, j],
+                                     'quadrant': quad_names.get(codes[b, j], '')})
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    result = pd.DataFrame(rows).sort_values(['frequency', 'benchmark', 'window_rs', 'window_mom', 'ticker'])
+    result.to_csv(grid['output'], index=False)
+    print(f"参数扫描完成: {len(result)} 行已写入 {grid['output']}")
+    return result
+
+# ================= 轮动回测 =================
+# 整个 日期 × 板块 矩阵一次性完成象限判定、持仓、换手和收益计算, 没有逐日循环。
+
+QUADRANT_CODES = {'leading': 0, 'weakening': 1, 'lagging': 2, 'improving': 3}
+
+def classify_quadrants(ratio, momentum):
+    """矩阵版象限判定, 口径与 get_quadrant_color 一致; 坐标缺失记为 -1"""
+    ratio, momentum = np.asarray(ratio), np.asarray(momentum)
+    with np.errstate(invalid='ignore'):
+        codes = np.select(
+            [(ratio > 100) & (momentum > 100), (ratio < 100) & (momentum > 100), (ratio < 100) & (momentum < 100)],
+            [QUADRANT_CODES['leading'], QUADRANT_CODES['improving'], QUADRANT_CODES['lagging']],
+            default=QUADRANT_CODES['weakening'])
+    codes[~(np.isfinite(ratio) & np.isfinite(momentum))] = -1
+    return codes
+
+def performance_stats(returns, periods_per_year=252):
+    """日收益序列的常用绩效指标"""
+    returns = np.asarray(returns, dtype=np.float64)
+    equity = np.cumprod(1 + returns)
+    years = len(returns) / periods_per_year
+    vol = returns.std() * np.sqrt(periods_per_year)
+    return {
+        'total_return': equity[-1] - 1,
+        'cagr': equity[-1] ** (1 / years) - 1 if years > 0 else np.nan,
+        'volatility': vol,
+        'sharpe': returns.mean() * periods_per_year / vol if vol > 0 else np.nan,
+        'max_drawdown': (equity / np.maximum.accumulate(equity) - 1).min(),
+    }
+
+def backtest_rotation(df_close, sectors=None, benchmark=None, config=None):
+    """按 RRG 象限轮动的回测, 返回每日收益、持仓和绩效"""
+    config = config or BACKTEST_CONFIG
+    sectors = [s for s in (sectors or SECTOR_CONFIG['SECTORS']) if s in df_close.columns]
+    benchmark = benchmark or SECTOR_CONFIG['BENCHMARK']
+    closes = df_close[sectors + [benchmark]].ffill()
+
+    res = compute_rrg_matrix(closes[sectors].to_numpy(), closes[benchmark].to_numpy(), config['window_rs'], config['window_mom'])
+    codes = classify_quadrants(res['ratio'], res['momentum'])
+    signal = np.isin(codes, [QUADRANT_CODES[q] for q in config['hold_quadrants']])
+    n_held = signal.sum(axis=1, keepdims=True)
+    target = np.divide(signal, n_held, out=np.zeros(signal.shape), where=n_held > 0)
+
+    # 非每日调仓时, 只在周期最后一个交易日更新目标权重, 其余日期沿用
+    if config['rebalance'] != 'D':
+        period_end = closes.index.to_series().groupby(closes.index.to_period(config['rebalance'])).transform('max') == closes.index
+        target = pd.DataFrame(np.where(period_end.to_numpy()[:, None], target, np.nan)).ffill().fillna(0).to_numpy()
+
+    # 收盘产生信号, 次日开始持有 (持仓按目标权重计, 不考虑周期内权重漂移)
+    held = np.vstack([np.zeros((1, len(sectors))), target[:-1]])
+    sector_ret = closes[sectors].pct_change().fillna(0).to_numpy()
+    turnover = np.abs(np.diff(held, axis=0, prepend=0)).sum(axis=1)
+    strategy = (held * sector_ret).sum(axis=1) - turnover * config['cost_bps'] / 1e4
 
-    rrg = calculate_rrg_components(df_all)
-    ind = calculate_indicators(INDICATORS, df_all)
-    generate_dashboard(rrg, ind)
-    send_telegram(rrg, ind)
+    # 从第一个有有效信号的日期开始评估
+    start = int(np.argmax((codes >= 0).any(axis=1))) + 1
+    bench_ret = closes[benchmark].pct_change().fillna(0).to_numpy()
+    daily = pd.DataFrame({
+        'strategy': strategy, 'benchmark': bench_ret, 'equal_weight': sector_ret.mean(axis=1), 'turnover': turnover,
+    }, index=closes.index).iloc[start:]
+
+    stats = {name: performance_stats(daily[name]) for name in ['strategy', 'benchmark', 'equal_weight']}
+    stats['strategy']['turnover_per_year'] = daily['turnover'].mean() * 252
+    return {'daily': daily, 'weights': pd.DataFrame(held, index=closes.index, columns=sectors).iloc[start:], 'stats': stats}
+
+def run_backtest(config=None):
+    """轮动回测入口"""
+    config = config or BACKTEST_CONFIG
+    df_all = get_data_and_synthesize(config['period'])
+    if df_all.empty: return
+    result = backtest_rotation(df_all, config=config)
+    daily = result['daily']
+    print(f"回测区间: {daily.index[0].date()} ~ {daily.index[-1].date()}, 持有象限: {config['hold_quadrants']}, "
+          f"调仓: {config['rebalance']}, 成本: {config['cost_bps']}bp")
+    print(pd.DataFrame(result['stats']).T.to_string(float_format=lambda v: f"{v:.4f}"))
+    (1 + daily[['strategy', 'benchmark', 'equal_weight']]).cumprod().to_csv(config['output'])
+    print(f"净值曲线已写入 {config['output']}")
+    return result
+
+def main(resume=True):
+    try:
+        # 同一交易日、同一配置的重跑从检查点继续: 已完成的阶段直接读结果, 已推送过的不再推送
+        run_dir = open_run_state(fresh=not resume) if RUN_STATE_CONFIG['enabled'] else None
+        with track_stage('fetch') as stage:
+            # 改为调用新的包含合成逻辑的数据获取函数
+            df_all = checkpoint(run_dir, 'panel', lambda: get_data_and_synthesize(PRICE_PERIOD), complete=panel_complete)
+            stage.update(tickers=df_all.shape[1], rows=len(df_all))
+        if df_all.empty:
+            write_run_report('no_data')
+            return
+        # 面板不完整时后续阶段的结果也不完整, 整次运行都不用检查点
+        if not has_checkpoint(run_dir, 'panel'):
+            run_dir = None
+        run_pipeline(df_all, run_dir)
+    except Exception as e:
+        write_run_report('failed', repr(e))
+        raise
+    write_run_report()
+
+def run_pipeline(df_all, run_dir=None):
+    """从价格面板开始的完整流程: 增量状态、重采样、RRG、指标、事件、推送和看板"""
+    with track_stage('stream_state'):
+        # 维护增量状态, 供盘中模式直接在此基础上逐根推进
+        refresh_stream_state(df_all)
+
+    # 日线总是计算 (Telegram 推送用), 其他周期按看板配置计算
+    timeframes = ['D'] + [tf for tf in DASHBOARD_TIMEFRAMES if tf != 'D']
+    with track_stage('resample'):
+        panels = {tf: resample_closes(df_all, tf) for tf in timeframes}
+    with track_stage('rrg') as stage:
+        rrgs = checkpoint(run_dir, 'rrg', lambda: {
+            tf: calculate_rrg_components(panels[tf], window_rs=TIMEFRAMES[tf]['window_rs'], window_mom=TIMEFRAMES[tf]['window_mom'])
+            for tf in timeframes})
+        stage['series'] = sum(len(r) for r in rrgs.values())
+    with track_stage('indicators') as stage:
+        def compute_indicators():
+            # 比值扫描按日线排名, 选出的指标在各周期上共用
+            indicators = select_indicators(panels['D'])
+            return {tf: calculate_indicators(indicators, panels[tf]) for tf in timeframes}
+        inds = checkpoint(run_dir, 'indicators', compute_indicators)
+        stage['series'] = sum(len(r) for r in inds.values())
+        stage['scanned_pairs'] = len(ratio_scan_pairs()) if RATIO_SCAN['enabled'] else 0
+    rrg, ind = rrgs['D'], inds['D']
+    events, event_state = None, None
+    if EVENTS_CONFIG['enabled']:
+        with track_stage('events') as stage:
+            events, event_state = checkpoint(run_dir, 'events', lambda: scan_new_events(panels['D']))
+            stage['events'] = len(events)
+    # 推送在后台线程进行, 和生成看板并行; 推送成功后才推进事件状态并记下已推送, 失败时下次运行会补报
+    def mark_sent(delivered=True):
+        if event_state is not None:
+            save_event_state(event_state)
+        save_checkpoint(run_dir, 'telegram', {'sent_at': datetime.now().isoformat(timespec='seconds'), 'delivered': delivered})
+
+    sent = load_checkpoint(run_dir, 'telegram')
+    telegram = None
+    if sent is not None:
+        print(f"本交易日已推送过 Telegram ({sent['sent_at']}), 跳过")
+    else:
+        telegram = send_telegram(rrg, ind, events, on_sent=mark_sent)
+        if telegram is None:
+            mark_sent(delivered=False)
+    with track_stage('dashboard') as stage:
+        outputs = [DASHBOARD_CONFIG['output']]
+        if DASHBOARD_CONFIG['payload'] == 'external':
+            outputs.append(os.path.splitext(outputs[0])[0] + '.json')
+        if not restore_checkpoint_files(run_dir, 'dashboard', outputs):
+            animations = None
+            if ANIMATION_CONFIG['enabled']:
+                animations = {tf: build_rrg_animation(panels[tf], window_rs=TIMEFRAMES[tf]['window_rs'], window_mom=TIMEFRAMES[tf]['window_mom'],
+                                                      history=ANIMATION_CONFIG['history'].get(tf)) for tf in DASHBOARD_TIMEFRAMES}
+            generate_dashboard(rrg, ind, DASHBOARD_CONFIG['output'], timeframes={tf: (rrgs[tf], inds[tf]) for tf in DASHBOARD_TIMEFRAMES},
+                               animations=animations)
+            save_checkpoint_files(run_dir, 'dashboard', outputs)
+        stage['output_bytes'] = os.path.getsize(DASHBOARD_CONFIG['output'])
+    with track_stage('telegram_wait'):
+        if telegram is not None:
+            telegram.join(timeout=300)
+
+# ================= 多看板 =================
+# 父进程一次取回所有看板用到的 Ticker 的并集, 面板放进共享内存; 每个看板在工作进程里套用自己的配置,
+# 在同一份面板上走完整流程 (计算、出图、推送), 最慢的出图步骤因此按 CPU 核数并行。
+
+_DASHBOARD_PANEL = {}
+
+def _attach_dashboard_panel(spec, index, columns):
+    """工作进程初始化: 把共享内存中的面板包装成 DataFrame (不拷贝)"""
+    shm, values = _attach_shared(spec)
+    _DASHBOARD_PANEL.update(shm=shm, df=pd.DataFrame(values, index=index, columns=columns, copy=False))
+
+def _dashboard_task(settings, resume=True, checkpoints=True):
+    """单个看板: 同一工作进程会先后处理多个看板, 每次先清空运行报告再套用配置"""
+    RUN_REPORT['stages'].clear()
+    RUN_REPORT['counters'].clear()
+    apply_dashboard_settings(settings)
+    run_dir = open_run_state(fresh=not resume) if checkpoints else None
+    run_pipeline(_DASHBOARD_PANEL['df'], run_dir)
+    return {'output': settings['output'], 'stages': copy.deepcopy(RUN_REPORT['stages']), 'counters': dict(RUN_REPORT['counters'])}
+
+def build_dashboards(names=None, path=None, resume=True, workers=None):
+    """多看板模式: 配置文件中的 (或指定的) 看板一次运行全部生成, 返回 {看板: 结果}"""
+    config = load_config_file(path)
+    if not config or not config.get('dashboards'):
+        raise ValueError(f"多看板模式需要在配置文件 {path or CONFIG_FILE} 中定义 dashboards")
+    names = names or list(config['dashboards'])
+    settings = [dashboard_settings(config, n) for n in names]
+    needed = set()
+    for st in settings:
+        real, synthetics = resolve_tickers(st['sector_config'], st['indicators'], st['synthetic_config'], st['ratio_scan'])
+        needed |= real | set(synthetics)
+    # 合成指数定义来自同一个文件, 任一看板的配置都可以用来取数
+    apply_dashboard_settings(settings[0])
+
+    results = {}
+    try:
+        with track_stage('fetch') as stage:
+            df_all = get_data_and_synthesize(PRICE_PERIOD, extra_tickers=sorted(needed))
+            stage.update(tickers=df_all.shape[1], rows=len(df_all))
+        if df_all.empty:
+            write_run_report('no_data')
+            return results
+        checkpoints = RUN_STATE_CONFIG['enabled'] and panel_complete(df_all)
+        workers = workers or DASHBOARD_CONFIG['workers'] or os.cpu_count()
+        print(f"多看板: {len(settings)} 个看板共用 {df_all.shape[1]} 列的面板, {workers} 个工作进程 ...")
+        shm, spec = _share_array(df_all.to_numpy())
+        try:
+            with track_stage('dashboards') as stage, ProcessPoolExecutor(
+                    max_workers=workers, initializer=_attach_dashboard_panel, initargs=(spec, df_all.index, list(df_all.columns))) as pool:
+                futures = {pool.submit(_dashboard_task, st, resume, checkpoints): st['name'] for st in settings}
+                for fut in as_completed(futures):
+                    name = futures[fut]
+                    try:
+                        results[name] = dict(fut.result(), status='ok')
+                        print(f"看板 {name} 完成: {results[name]['output']}")
+                    except Exception as e:
+                        results[name] = {'status': 'failed', 'error': repr(e)}
+                        print(f"看板 {name} 失败: {e!r}")
+                stage['dashboards'] = len(settings)
+        finally:
+            shm.close()
+            shm.unlink()
+    except Exception as e:
+        write_run_report('failed', repr(e))
+        raise
+    RUN_REPORT['dashboards'] = results
+    failed = [n for n, r in results.items() if r['status'] != 'ok']
+    write_run_report('failed' if failed else 'ok', f"失败的看板: {failed}" if failed else None)
+    if failed:
+        raise RuntimeError(f"{len(failed)} 个看板生成失败: {failed}")
+    return results
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="量化交易员看板")
+    parser.add_argument('--build-store', action='store_true', help="下载长历史并写入内存映射价格库")
+    parser.add_argument('--batch', action='store_true', help="参数扫描: 并行计算多基准、多窗口、多周期的 RRG")
+    parser.add_argument('--backtest', action='store_true', help="轮动回测: 按象限持有板块并计算全历史收益")
+    parser.add_argument('--stream', action='store_true', help="盘中模式: 消费 K 线流并实时更新 RRG 和指标")
+    parser.add_argument('--no-resume', action='store_true', help="清空本交易日的检查点, 从头重跑 (会重新推送)")
+    parser.add_argument('--config', default=CONFIG_FILE, help="配置文件 (TOML/YAML), 不存在时使用 main.py 中的配置")
+    parser.add_argument('--dashboard', default=DASHBOARD_NAME, help="使用配置文件中的哪个看板 (默认 default_dashboard)")
+    parser.add_argument('--all-dashboards', nargs='*', metavar='NAME', help="多看板模式: 共用一份数据并行生成配置文件中的全部 (或列出的) 看板")
+    parser.add_argument('--workers', type=int, help="多看板模式的工作进程数")
+    args = parser.parse_args()
+
+    if args.all_dashboards is None:
+        apply_dashboard(args.dashboard, args.config)
+
+    if args.all_dashboards is not None:
+        build_dashboards(args.all_dashboards or None, args.config, resume=not args.no_resume, workers=args.workers)
+    elif args.build_store:
+        build_price_store()
+    elif args.batch:
+        run_batch()
+    elif args.backtest:
+        run_backtest()
+    elif args.stream:
+        run_intraday()
+    else:
+        main(resume=not args.no_resume)
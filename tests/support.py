@@ -0,0 +1,57 @@
+"""
+测试公用部分: 把仓库根目录加入 sys.path, 生成确定性的离线价格面板;
+OfflineTestCase 在每个用例前把 main 切到 memory 数据源、关闭所有磁盘缓存, 用例结束后恢复被改动的配置
+
+    python -m unittest discover -s tests
+"""
+import copy
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+import main
+
+# 用例可能改写的 main 模块级配置
+_GLOBALS = ['SECTOR_CONFIG', 'INDICATORS', 'SYNTHETIC_CONFIG', 'RATIO_SCAN', 'DATA_SOURCE', 'CACHE_CONFIG',
+            'RESULT_CACHE', 'MMAP_STORE', 'RUN_STATE_CONFIG', 'EVENTS_CONFIG', 'TELEGRAM_CONFIG', 'TG_BOT_TOKEN',
+            'TG_CHAT_ID', 'MEMORY_PRICES', 'STREAM_STATE_PATH']
+
+
+def make_prices(tickers, n_days=400, seed=0, end="2025-12-31"):
+    """几何布朗运动价格面板 (日期×Ticker), 同样的参数总是得到同样的数据"""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=end, periods=n_days)
+    log_ret = rng.normal(0.0003, 0.012, size=(n_days, len(tickers)))
+    return pd.DataFrame(100 * np.exp(np.cumsum(log_ret, axis=0)), index=index, columns=list(tickers))
+
+
+class OfflineTestCase(unittest.TestCase):
+    """离线用例基类: memory 数据源, 不读写价格缓存、结果缓存和检查点, 工作目录为临时目录"""
+
+    def setUp(self):
+        self._saved = {name: copy.deepcopy(getattr(main, name)) for name in _GLOBALS}
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        main.DATA_SOURCE['provider'] = 'memory'
+        main.CACHE_CONFIG['enabled'] = False
+        main.RESULT_CACHE['enabled'] = False
+        main.RUN_STATE_CONFIG['enabled'] = False
+        main.STREAM_STATE_PATH = os.path.join(self._tmp.name, "stream_state.pkl")
+        main.EVENTS_CONFIG['state_path'] = os.path.join(self._tmp.name, "event_state.json")
+        for cache in (main._SERIES_MEMO, main._SYNTH_CACHE, main._RESAMPLE_CACHE):
+            cache.clear()
+
+    def tearDown(self):
+        for name, value in self._saved.items():
+            setattr(main, name, value)
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
@@ -0,0 +1,116 @@
+"""事件提醒: 矩阵版的状态切换检测与逐日循环对比, 以及 last_date / max_catchup 对补报范围的限制"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from support import OfflineTestCase, main, make_prices
+
+
+def loop_quadrant(x, y):
+    """单点的象限判定, 口径同 get_quadrant_color"""
+    if x > 100 and y > 100: return main.QUADRANT_NAMES['leading']
+    if x < 100 and y > 100: return main.QUADRANT_NAMES['improving']
+    if x < 100 and y < 100: return main.QUADRANT_NAMES['lagging']
+    return main.QUADRANT_NAMES['weakening']
+
+
+def loop_events(df_close, sector_config, indicators, cross_mas, window_rs=60, window_mom=10):
+    """逐日循环的参考实现: 象限切换和均线穿越, 前后两天都有值才算一次切换"""
+    events = set()
+    benchmark = sector_config['BENCHMARK']
+    for sec, desc in sector_config['SECTORS'].items():
+        if sec not in df_close.columns:
+            continue
+        rs = df_close[sec] / df_close[benchmark]
+        x = 100 * (rs / rs.rolling(window_rs).mean())
+        y = 100 * (x / x.rolling(window_mom).mean())
+        for t in range(1, len(df_close)):
+            if not np.isfinite([x.iloc[t - 1], y.iloc[t - 1], x.iloc[t], y.iloc[t]]).all():
+                continue
+            prev, cur = loop_quadrant(x.iloc[t - 1], y.iloc[t - 1]), loop_quadrant(x.iloc[t], y.iloc[t])
+            if prev != cur:
+                events.add((df_close.index[t], 'quadrant', f"{sec} {desc}: {prev} → {cur}"))
+    for item in indicators:
+        close = df_close[item['numerator']] / df_close[item['denominator']]
+        for col in cross_mas:
+            w = int(col[3:])
+            ma = close.rolling(w).mean() if col.startswith('sma') else close.ewm(span=w, adjust=False).mean()
+            for t in range(1, len(close)):
+                if not np.isfinite([close.iloc[t - 1], ma.iloc[t - 1], close.iloc[t], ma.iloc[t]]).all():
+                    continue
+                above = close.iloc[t] > ma.iloc[t]
+                if above != (close.iloc[t - 1] > ma.iloc[t - 1]):
+                    events.add((df_close.index[t], 'ma_cross', f"{item['name']} {'上穿' if above else '跌破'} {col.upper()}"))
+    return events
+
+
+class EventDetectionTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.RATIO_SCAN['enabled'] = False
+        main.set_memory_prices(make_prices(sorted(main.collect_real_tickers()), n_days=500, seed=4))
+        self.df = main.get_data_and_synthesize('max')
+
+    def detected(self, kinds=('quadrant', 'ma_cross'), since_row=0):
+        return {(pd.Timestamp(e['date']), e['kind'], e['text'])
+                for e in main.detect_events(self.df, since_row) if e['kind'] in kinds}
+
+    def test_matches_daily_loop(self):
+        expected = loop_events(self.df, main.SECTOR_CONFIG, main.INDICATORS, main.EVENTS_CONFIG['cross_mas'])
+        self.assertGreater(len({k for _, k, _ in expected}), 1)
+        self.assertEqual(self.detected(), expected)
+
+    def test_matches_daily_loop_with_gaps(self):
+        # 一个板块前 100 天没有数据, 另一个中途停牌 3 天: 缺失的前后不算切换
+        self.df.iloc[:100, self.df.columns.get_loc('XLC')] = np.nan
+        self.df.iloc[300:303, self.df.columns.get_loc('XLU')] = np.nan
+        expected = loop_events(self.df, main.SECTOR_CONFIG, main.INDICATORS, main.EVENTS_CONFIG['cross_mas'])
+        self.assertEqual(self.detected(), expected)
+
+    def test_since_row(self):
+        since = len(self.df) - 50
+        full = {e for e in self.detected() if e[0] >= self.df.index[since]}
+        self.assertEqual(self.detected(since_row=since), full)
+
+
+class NewEventScanTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.RATIO_SCAN['enabled'] = False
+        main.set_memory_prices(make_prices(sorted(main.collect_real_tickers()), n_days=500, seed=4))
+        self.df = main.get_data_and_synthesize('max')
+        self.all_events = main.detect_events(self.df)
+        self.last = self.df.index[-1].strftime('%Y-%m-%d')
+
+    def events_on(self, dates):
+        dates = {d.strftime('%Y-%m-%d') for d in dates}
+        return [e for e in self.all_events if e['date'] in dates]
+
+    def scan(self, last_date):
+        state = {'last_date': last_date} if last_date else {}
+        events, new_state = main.scan_new_events(self.df, state=state)
+        self.assertEqual(new_state, {'last_date': self.last, 'last_events': len(events)})
+        return sorted(events, key=str)
+
+    def test_without_state_reports_latest_day_only(self):
+        self.assertEqual(self.scan(None), sorted(self.events_on(self.df.index[-1:]), key=str))
+
+    def test_reports_days_after_last_date(self):
+        last_date = self.df.index[-4].strftime('%Y-%m-%d')
+        self.assertEqual(self.scan(last_date), sorted(self.events_on(self.df.index[-3:]), key=str))
+
+    def test_stale_state_is_limited_to_max_catchup(self):
+        main.EVENTS_CONFIG['max_catchup'] = 20
+        expected = self.events_on(self.df.index[-20:])
+        self.assertTrue(expected)
+        self.assertEqual(self.scan(self.df.index[-200].strftime('%Y-%m-%d')), sorted(expected, key=str))
+
+    def test_up_to_date_state_reports_nothing(self):
+        self.assertEqual(self.scan(self.last), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
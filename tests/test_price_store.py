@@ -0,0 +1,58 @@
+"""长历史价格库: 追加新日期、新 Ticker、复权价调整和向前扩展历史后, 读回的数据与合并后的面板一致"""
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from support import OfflineTestCase, main, make_prices
+
+
+class PriceStoreTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self._tmp.name, "store")
+        self.df = make_prices(['SPY', 'XLK', 'XLE'], n_days=300, seed=3)
+        # 小于行数的块, 让重写路径分多块搬运
+        main.MMAP_STORE['chunk_rows'] = 64
+
+    def read(self):
+        return main.slice_price_store(main.open_price_store(self.path))
+
+    def test_append_new_dates(self):
+        main.write_price_store(self.df.iloc[:200], self.path, dtype='float64')
+        # 新数据和库有一段重叠
+        main.update_price_store(self.df.iloc[150:], self.path)
+        pd.testing.assert_frame_equal(self.read(), self.df, check_freq=False)
+
+    def test_new_ticker(self):
+        main.write_price_store(self.df.iloc[:200, :2], self.path, dtype='float64')
+        main.update_price_store(self.df.iloc[100:], self.path)
+        expected = self.df.copy()
+        # 新 Ticker 只有新数据覆盖的历史
+        expected.iloc[:100, 2] = np.nan
+        pd.testing.assert_frame_equal(self.read(), expected, check_freq=False)
+
+    def test_adjusted_history_is_rewritten(self):
+        main.write_price_store(self.df.iloc[:200], self.path, dtype='float64')
+        # 分红后 XLE 的全部历史按比例下调, 新数据只覆盖最近一段
+        adjusted = self.df.copy()
+        adjusted['XLE'] *= 0.98
+        main.update_price_store(adjusted.iloc[150:], self.path)
+        pd.testing.assert_frame_equal(self.read(), adjusted, check_freq=False, rtol=1e-12)
+
+    def test_prepend_earlier_history(self):
+        # 3y 的库扩展到更长的区间
+        main.write_price_store(self.df.iloc[100:], self.path, dtype='float64')
+        main.update_price_store(self.df, self.path)
+        pd.testing.assert_frame_equal(self.read(), self.df, check_freq=False)
+
+    def test_prepend_with_new_ticker_and_new_dates(self):
+        main.write_price_store(self.df.iloc[100:200, :2], self.path, dtype='float64')
+        main.update_price_store(self.df, self.path)
+        pd.testing.assert_frame_equal(self.read(), self.df, check_freq=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
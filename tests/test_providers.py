@@ -0,0 +1,42 @@
+"""价格数据源: 本地快照和内存数据源的读取与按 period 截取"""
+import os
+import unittest
+
+import pandas as pd
+
+from support import OfflineTestCase, main, make_prices
+
+
+class PriceProviderTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.df = make_prices(['SPY', 'XLK', 'XLE'], n_days=300)
+
+    def test_local_snapshot_round_trip(self):
+        main.save_price_snapshot(self.df, 'snap')
+        # csv 快照与 parquet 混用
+        os.remove(os.path.join('snap', 'XLE.parquet'))
+        self.df[['XLE']].rename(columns={'XLE': 'Close'}).to_csv(os.path.join('snap', 'XLE.csv'))
+        main.DATA_SOURCE.update(provider='local', path='snap')
+        out = main.fetch_local_files(['SPY', 'XLK', 'XLE'], period='max')
+        pd.testing.assert_frame_equal(out[self.df.columns], self.df, check_freq=False, check_names=False)
+
+    def test_period_is_relative_to_last_date(self):
+        main.set_memory_prices(self.df)
+        out = main.fetch_memory(['SPY', 'XLK'], period='6mo')
+        self.assertEqual(list(out.columns), ['SPY', 'XLK'])
+        self.assertEqual(out.index[-1], self.df.index[-1])
+        self.assertGreaterEqual(out.index[0], self.df.index[-1] - pd.DateOffset(months=6))
+
+    def test_period_strings(self):
+        end = pd.Timestamp('2025-06-30')
+        self.assertEqual(main._period_start('ytd', end), pd.Timestamp('2025-01-01'))
+        self.assertEqual(main._period_start('2wk', end), pd.Timestamp('2025-06-16'))
+        self.assertIsNone(main._period_start('max', end))
+        with self.assertRaises(ValueError):
+            main._period_start('3 years', end)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""均线状态: 向量化分类与最初的逐行文字判断对比"""
+import unittest
+
+import numpy as np
+
+from support import OfflineTestCase, main, make_prices
+
+
+def baseline_ma_status(current_val, row):
+    """最初版本的 get_ma_status_text"""
+    mas = {'SMA20': row['sma20'], 'EMA20': row['ema20'], 'SMA60': row['sma60'], 'EMA60': row['ema60'],
+           'SMA120': row['sma120'], 'EMA120': row['ema120']}
+    support_count = sum(1 for v in mas.values() if current_val > v)
+    if support_count == 6: return "🚀 **超强多头** (高于所有均线)"
+    if support_count == 0: return "🩸 **极度弱势** (低于所有均线)"
+    floor_ma, ceil_ma = None, None
+    for name, val in sorted(mas.items(), key=lambda item: item[1]):
+        if current_val > val: floor_ma = name
+        else:
+            ceil_ma = name
+            break
+    if floor_ma and ceil_ma: return f"⚖️ **震荡** ({floor_ma} < 现价 < {ceil_ma})"
+    return f"⚠️ **均线纠缠** (支撑: {support_count}/6)"
+
+
+class MARegimeTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.set_memory_prices(make_prices(sorted(main.collect_real_tickers()), n_days=600))
+        self.df = main.get_data_and_synthesize('max')
+
+    def test_ma_regime_matches_baseline_text(self):
+        for res in main.calculate_indicators(main.INDICATORS, self.df):
+            df, regime = res['df'], res['regime']
+            # 跳过均线尚未成形的前 120 天
+            for t in range(120, len(df)):
+                row, r = df.iloc[t], regime.iloc[t]
+                expected = baseline_ma_status(row['close'], row)
+                self.assertEqual(main.get_ma_status_text(row['close'], row), expected)
+                self.assertEqual(main.format_ma_status(int(r['support']), int(r['floor']), int(r['ceil']), int(r['regime'])), expected)
+
+
+    def test_missing_mas_are_not_support(self):
+        r = main.classify_ma_regime([1.0, 1.0], [[np.nan] * 6, [0.5, np.nan, 2.0, 2.0, 2.0, 2.0]])
+        self.assertEqual(r['support'].tolist(), [0, 1])
+        self.assertEqual(r['regime'].tolist(), [0, 2])
+
+    def test_regime_stats(self):
+        stats = main.regime_stats(np.array([0, 0, 2, 2, 2, 3, 0, 0]))
+        self.assertEqual(stats['current'], main.REGIME_LABELS[0])
+        self.assertEqual(stats['current_run'], 2)
+        self.assertEqual(stats['avg_run'][main.REGIME_LABELS[0]], 2.0)
+        self.assertAlmostEqual(stats['share'][main.REGIME_LABELS[2]], 3 / 8)
+        self.assertEqual(main.regime_stats(np.array([])), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""结果缓存: 命中、代码版本变化后失效、超过容量后淘汰"""
+import os
+import unittest
+
+from support import OfflineTestCase, main, make_prices
+
+
+class ResultCacheTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.RESULT_CACHE.update(enabled=True, dir=os.path.join(self._tmp.name, "results"))
+        main.RUN_REPORT['counters'].clear()
+        self.df = make_prices(['A', 'B'], n_days=50)
+        self.calls = []
+
+    def compute(self):
+        self.calls.append(1)
+        return self.df['A'].sum()
+
+    def cached(self, config=None):
+        return main.cached_result('test', self.df, ['A'], config or {}, self.compute)
+
+    def test_hit_after_first_call(self):
+        self.assertEqual(self.cached(), self.cached())
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(main.RUN_REPORT['counters']['result_cache_hits'], 1)
+
+    def test_key_depends_on_inputs(self):
+        self.cached()
+        self.cached({'window': 20})
+        self.df.iloc[-1, 0] += 1.0
+        self.cached()
+        # 没用到的列变化不影响键
+        self.df.iloc[-1, 1] += 1.0
+        self.cached()
+        self.assertEqual(len(self.calls), 3)
+
+    def test_code_version_change_invalidates(self):
+        self.cached()
+        main.RESULT_CACHE['version'] = 'other'
+        self.cached()
+        self.assertEqual(len(self.calls), 2)
+
+    def test_evicts_least_recently_used(self):
+        self.cached()
+        (old,) = [e.path for e in os.scandir(main.RESULT_CACHE['dir'])]
+        os.utime(old, (0, 0))
+        # 只容得下一个结果: 写入第二个时淘汰最久没用的第一个
+        main.RESULT_CACHE['max_bytes'] = os.path.getsize(old)
+        self.cached({'window': 20})
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(len(os.listdir(main.RESULT_CACHE['dir'])), 1)
+        self.assertEqual(main.RUN_REPORT['counters']['result_cache_evictions'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
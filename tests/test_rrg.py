@@ -0,0 +1,122 @@
+"""RRG 坐标和指标均线与最初的逐列 pandas 实现对比"""
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from support import OfflineTestCase, main, make_prices
+
+
+def baseline_rrg(df_close, sector_config, window_rs=60, window_mom=10):
+    """最初版本的 calculate_rrg_components: 每个板块单独用 pandas rolling 计算"""
+    benchmark = sector_config['BENCHMARK']
+    rrg_data = {}
+    for sec, config_val in sector_config['SECTORS'].items():
+        if sec not in df_close.columns or benchmark not in df_close.columns:
+            continue
+        rs_raw = df_close[sec] / df_close[benchmark]
+        r_ratio = 100 * (rs_raw / rs_raw.rolling(window=window_rs).mean())
+        r_mom = 100 * (r_ratio / r_ratio.rolling(window=window_mom).mean())
+        emoji = config_val.split(' ')[0] if ' ' in config_val else ''
+        rrg_data[sec] = {'chart_label': f"{emoji} {sec}", 'display_name': f"{sec} {config_val}",
+                         'x': r_ratio.tail(5).values, 'y': r_mom.tail(5).values,
+                         'current_x': r_ratio.iloc[-1], 'current_y': r_mom.iloc[-1]}
+    return rrg_data
+
+
+def baseline_indicator(df_close, item):
+    ratio = df_close[item['numerator']] / df_close[item['denominator']]
+    df = pd.DataFrame({'close': ratio})
+    for w in [20, 60, 120]:
+        df[f'sma{w}'] = df['close'].rolling(window=w).mean()
+        df[f'ema{w}'] = df['close'].ewm(span=w, adjust=False).mean()
+    return df
+
+
+class RRGRegressionTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.set_memory_prices(make_prices(sorted(main.collect_real_tickers()), n_days=600))
+        self.df = main.get_data_and_synthesize('max')
+
+    def test_rrg_matches_baseline(self):
+        # 一个板块前 100 天没有数据, 检查缺失值的传播
+        self.df.iloc[:100, self.df.columns.get_loc('XLC')] = np.nan
+        expected = baseline_rrg(self.df, main.SECTOR_CONFIG)
+        actual = main.calculate_rrg_components(self.df)
+        self.assertEqual(list(actual), list(expected))
+        for sec, exp in expected.items():
+            got = actual[sec]
+            self.assertEqual(got['chart_label'], exp['chart_label'])
+            self.assertEqual(got['display_name'], exp['display_name'])
+            np.testing.assert_allclose(got['x'], exp['x'], rtol=1e-12)
+            np.testing.assert_allclose(got['y'], exp['y'], rtol=1e-12)
+            np.testing.assert_allclose([got['current_x'], got['current_y']], [exp['current_x'], exp['current_y']], rtol=1e-12)
+
+    def test_rrg_windows(self):
+        expected = baseline_rrg(self.df, main.SECTOR_CONFIG, window_rs=20, window_mom=5)
+        actual = main.calculate_rrg_components(self.df, window_rs=20, window_mom=5)
+        for sec, exp in expected.items():
+            np.testing.assert_allclose(actual[sec]['x'], exp['x'], rtol=1e-12)
+
+    def test_indicators_match_baseline(self):
+        results = main.calculate_indicators(main.INDICATORS, self.df)
+        self.assertEqual([r['meta']['name'] for r in results], [i['name'] for i in main.INDICATORS])
+        for res in results:
+            expected = baseline_indicator(self.df, res['meta'])
+            pd.testing.assert_frame_equal(res['df'][expected.columns], expected, rtol=1e-12)
+            self.assertEqual(res['latest_value'], expected['close'].iloc[-1])
+
+    def test_ema_matrix_with_nan_gaps(self):
+        # 开头缺失、中途连续缺失, 以及逐列不同的 span
+        arr = np.array([[1, 2, np.nan, np.nan, 5, 6, 7], [np.nan, np.nan, 1, np.nan, 3, np.nan, 4]]).T
+        actual = main.ema_matrix(arr, [3, 5])
+        for j, span in enumerate([3, 5]):
+            np.testing.assert_allclose(actual[:, j], pd.Series(arr[:, j]).ewm(span=span, adjust=False).mean(), equal_nan=True)
+
+    def test_indicators_with_nan_gaps_match_baseline(self):
+        self.df.iloc[300:305, self.df.columns.get_loc('XLU')] = np.nan
+        self.df.iloc[400, self.df.columns.get_loc('XLP')] = np.nan
+        for res in main.calculate_indicators(main.INDICATORS, self.df):
+            expected = baseline_indicator(self.df, res['meta'])
+            pd.testing.assert_frame_equal(res['df'][expected.columns], expected, rtol=1e-12)
+
+    def test_resample_closes(self):
+        self.df.iloc[200:203, self.df.columns.get_loc('XLU')] = np.nan
+        weekly = main.resample_closes(self.df, 'W')
+        # 每周最后一个交易日的收盘价 (缺失向前填充), 索引为该交易日
+        expected = self.df.ffill().groupby(self.df.index.to_period('W-FRI')).tail(1)
+        pd.testing.assert_frame_equal(weekly, expected)
+        # 同一面板只重采样一次; 面板被回收后缓存随之清掉
+        self.assertIs(main.resample_closes(self.df, 'W'), weekly)
+        del self.df, weekly
+        self.assertEqual(main._RESAMPLE_CACHE, {})
+
+    def test_dashboard_scan_picks(self):
+        main.RATIO_SCAN.update(enabled=True, top_n=2)
+        indicators = main.select_indicators(self.df)
+        ind = main.calculate_indicators(indicators, self.df)
+        rrg = main.calculate_rrg_components(self.df)
+        per_indicator = 2 + 2 * len(main.MA_WINDOWS)  # 比值、各均线、DKJ
+        for plot in (False, True):
+            main.RATIO_SCAN['plot'] = plot
+            with self.subTest(plot=plot), mock.patch.object(main, 'write_dashboard_html') as write:
+                main.generate_dashboard(rrg, ind, "index.html")
+                fig = write.call_args[0][0]
+                # 选出的比值都列在标题下; 默认不画曲线, 打开后只画最近 6 个月
+                self.assertEqual(fig.layout.title.text.count('比值扫描'), 1)
+                n_plotted = len(ind) if plot else len(main.INDICATORS)
+                self.assertEqual(len(fig.data), 2 * len(rrg) + n_plotted * per_indicator)
+                if plot:
+                    ratio = fig.data[2 * len(rrg) + len(main.INDICATORS) * per_indicator]
+                    self.assertEqual(pd.Timestamp(ratio.x[0]), self.df.index[self.df.index >= self.df.index[-1] - pd.DateOffset(months=6)][0])
+
+    def test_missing_indicator_is_skipped(self):
+        items = main.INDICATORS + [{'name': 'missing', 'numerator': 'NOPE', 'denominator': 'SPY', 'description': ''}]
+        self.assertEqual(len(main.calculate_indicators(items, self.df)), len(main.INDICATORS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""运行检查点: 交易日的划分, 不完整的面板不写检查点, 同一交易日重跑不重复推送"""
+import os
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from support import OfflineTestCase, main, make_prices
+
+
+class ExpectedSessionTest(unittest.TestCase):
+
+    def session(self, now):
+        return main.expected_session(pd.Timestamp(now))
+
+    def test_close_boundary(self):
+        # 2025-12-11 是周四, 纽约冬令时 (UTC-5)
+        self.assertEqual(self.session("2025-12-11 15:59:59-05:00"), pd.Timestamp("2025-12-10"))
+        self.assertEqual(self.session("2025-12-11 16:00:00-05:00"), pd.Timestamp("2025-12-11"))
+        # 同一时刻用 UTC 表示, 结果相同
+        self.assertEqual(self.session("2025-12-11 20:59:59+00:00"), pd.Timestamp("2025-12-10"))
+        self.assertEqual(self.session("2025-12-11 21:00:00+00:00"), pd.Timestamp("2025-12-11"))
+
+    def test_utc_date_already_next_day(self):
+        # 纽约周四 20:00 在 UTC 已是周五凌晨, 仍属于周四
+        self.assertEqual(self.session("2025-12-12 01:00:00+00:00"), pd.Timestamp("2025-12-11"))
+
+    def test_weekend_and_monday_morning(self):
+        self.assertEqual(self.session("2025-12-13 12:00:00-05:00"), pd.Timestamp("2025-12-12"))
+        self.assertEqual(self.session("2025-12-14 18:00:00-05:00"), pd.Timestamp("2025-12-12"))
+        self.assertEqual(self.session("2025-12-15 09:30:00-05:00"), pd.Timestamp("2025-12-12"))
+
+
+class RunCheckpointTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.RUN_STATE_CONFIG.update(enabled=True, dir=os.path.join(self._tmp.name, "runs"))
+        main.TG_BOT_TOKEN = None
+        main.RUN_REPORT['failed_tickers'] = []
+        self.addCleanup(main.RUN_REPORT.__setitem__, 'failed_tickers', [])
+        main.set_memory_prices(make_prices(sorted(main.collect_real_tickers()), n_days=300))
+        self.df = main.get_data_and_synthesize('max')
+
+    def run_dir(self):
+        (name,) = os.listdir(main.RUN_STATE_CONFIG['dir'])
+        return os.path.join(main.RUN_STATE_CONFIG['dir'], name)
+
+    def run_main(self, fetch=None):
+        """运行一次主流程, 返回检查点目录中的文件; fetch 替换面板的获取"""
+        if fetch is None:
+            main.main()
+        else:
+            with mock.patch.object(main, 'get_data_and_synthesize', side_effect=fetch):
+                main.main()
+        return sorted(os.listdir(self.run_dir()))
+
+    def test_complete_panel_is_checkpointed(self):
+        self.assertIn('panel.pkl', self.run_main())
+
+    def test_failed_tickers_skip_all_checkpoints(self):
+        def fetch(period):
+            main.RUN_REPORT['failed_tickers'].append('XLK')
+            return self.df
+        # 面板不写检查点, 后续阶段 (包括推送记录) 也都不写
+        self.assertEqual(self.run_main(fetch), [])
+
+    def test_stale_online_panel_is_not_checkpointed(self):
+        # 在线数据源的面板只到 2025-12-31, 早于预期的交易日
+        main.DATA_SOURCE['provider'] = 'yfinance'
+        self.assertEqual(self.run_main(lambda period: self.df), [])
+
+    def test_rerun_skips_telegram_once_sent(self):
+        main.TG_BOT_TOKEN = 'test-token'
+
+        def send(rrg, ind, events=None, on_sent=None):
+            thread = threading.Thread(target=on_sent)
+            thread.start()
+            return thread
+
+        with mock.patch.object(main, 'send_telegram', side_effect=send) as sender:
+            self.assertIn('telegram.pkl', self.run_main())
+            self.assertTrue(main.load_checkpoint(self.run_dir(), 'telegram')['delivered'])
+            self.run_main()
+        sender.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""增量状态: 逐根推进的结果与在完整历史上重新计算的结果对比"""
+import asyncio
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from support import OfflineTestCase, main, make_prices
+
+
+class StreamStateTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.set_memory_prices(make_prices(sorted(main.collect_real_tickers()), n_days=500, seed=2))
+        # 合成指数 ERH 是季度调仓的 return 口径, 推进的 120 天里跨过调仓日, 检查锚点滚动
+        self.df = main.get_data_and_synthesize('max')
+        self.split = len(self.df) - 120
+
+    def assert_snapshot_matches(self, snapshot, df):
+        rrg = main.calculate_rrg_components(df)
+        self.assertEqual(set(snapshot['rrg']), set(rrg))
+        for sec, exp in rrg.items():
+            got = snapshot['rrg'][sec]
+            np.testing.assert_allclose([got['current_x'], got['current_y']], [exp['current_x'], exp['current_y']], rtol=1e-9)
+            np.testing.assert_allclose(got['x'], exp['x'], rtol=1e-9)
+            np.testing.assert_allclose(got['y'], exp['y'], rtol=1e-9)
+        for res in main.calculate_indicators(main.INDICATORS, df):
+            row, last = snapshot['indicators'][res['meta']['name']], res['df'].iloc[-1]
+            for col in last.index:
+                self.assertAlmostEqual(row[col] / last[col], 1.0, places=9, msg=f"{res['meta']['name']} {col}")
+
+    def test_advance_matches_full_recompute(self):
+        state = main.build_stream_state(self.df.iloc[:self.split])
+        snapshot = main.advance_stream_state(state, self.df)
+        self.assertEqual(state['date'], self.df.index[-1])
+        self.assert_snapshot_matches(snapshot, self.df)
+
+    def test_synthetic_bar_follows_rebalancing(self):
+        state = main.build_stream_state(self.df.iloc[:self.split])
+        for date, row in self.df.iloc[self.split:].iterrows():
+            # 只给成分股价格, 合成指数由锚点算出
+            main.update_stream_state(state, row.drop('ERH').to_dict(), date)
+            self.assertAlmostEqual(state['last_close']['ERH'] / row['ERH'], 1.0, places=10)
+
+    def test_uncommitted_bar_does_not_change_state(self):
+        state = main.build_stream_state(self.df.iloc[:self.split])
+        before = (state['date'], state['rs']['sum'].copy(), dict(state['ind_ema']))
+        row = self.df.iloc[self.split]
+        preview = main.update_stream_state(state, row.to_dict(), row.name, commit=False)
+        self.assertEqual(state['date'], before[0])
+        np.testing.assert_array_equal(state['rs']['sum'], before[1])
+        committed = main.update_stream_state(state, row.to_dict(), row.name)
+        for sec in preview['rrg']:
+            self.assertEqual(preview['rrg'][sec]['current_x'], committed['rrg'][sec]['current_x'])
+
+    def test_refresh_rebuilds_on_config_change(self):
+        main.refresh_stream_state(self.df.iloc[:self.split])
+        main.SECTOR_CONFIG = {'BENCHMARK': 'SPY', 'SECTORS': {'XLK': '⚔️ 科技', 'XLE': '🛢️ 能源'}}
+        state = main.refresh_stream_state(self.df)
+        self.assertEqual(state['sectors'], ['XLK', 'XLE'])
+        self.assertEqual(state['date'], self.df.index[-1])
+
+    def test_refresh_rebuilds_after_adjustment(self):
+        # 只推进几天, 旧尺度的价格还留在窗口里
+        main.refresh_stream_state(self.df.iloc[:-5])
+        # 分红后 auto_adjust 把 SPY 之前的全部收盘价按比例下调
+        adjusted = self.df.copy()
+        adjusted['SPY'] *= 0.99
+        state = main.refresh_stream_state(adjusted)
+        rebuilt = main.build_stream_state(adjusted)
+        np.testing.assert_allclose(state['tail_x'], rebuilt['tail_x'], rtol=1e-12)
+        np.testing.assert_allclose(state['rs']['sum'], rebuilt['rs']['sum'], rtol=1e-12)
+        for w in main.MA_WINDOWS:
+            np.testing.assert_allclose(state['ind_ema'][w], rebuilt['ind_ema'][w], rtol=1e-12)
+
+    def test_refresh_keeps_state_when_history_unchanged(self):
+        main.refresh_stream_state(self.df.iloc[:self.split])
+        with mock.patch.object(main, 'build_stream_state', wraps=main.build_stream_state) as build:
+            state = main.refresh_stream_state(self.df)
+        # 增量推进而不是重建
+        build.assert_not_called()
+        self.assertEqual(state['date'], self.df.index[-1])
+
+    def test_run_stream_with_timezone_offsets(self):
+        state = main.build_stream_state(self.df.iloc[:-2])
+        d1, d2 = self.df.index[-2], self.df.index[-1]
+
+        async def source():
+            # 同一交易日收盘前的 UTC 时间, 和带纽约时区偏移的下一交易日
+            yield pd.Timestamp(f"{d1:%Y-%m-%d} 19:00", tz='UTC'), self.df.loc[d1].to_dict()
+            yield pd.Timestamp(f"{d2:%Y-%m-%d} 10:00", tz='America/New_York'), self.df.loc[d2].to_dict()
+            # 纽约 20:00 在 UTC 已是第二天凌晨, 仍属于 d2
+            yield pd.Timestamp(f"{d2:%Y-%m-%d} 20:00", tz='America/New_York').tz_convert('UTC'), self.df.loc[d2].to_dict()
+
+        updates = []
+        asyncio.run(main.run_stream(state, source(), on_update=updates.append))
+        self.assertEqual(len(updates), 3)
+        self.assertEqual([u['date'].normalize() for u in updates], [d1, d2, d2])
+        # d1 在出现 d2 的 K 线时提交, d2 尚未收盘不提交
+        self.assertEqual(state['date'], d1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""合成指数: 向量化的除数计算与逐日持仓循环对比"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from support import OfflineTestCase, main, make_prices
+
+
+def loop_synthetic(prices, weights, index, rebalance='none', base=100.0):
+    """逐日循环的参考实现: 调仓日按当日收盘把指数点位按权重重新分配成持股数, 其余日子持股不变"""
+    prices = pd.DataFrame(prices).ffill().to_numpy()
+    weights = np.asarray(weights, dtype=np.float64) / np.sum(weights)
+    out = np.full(len(prices), np.nan)
+    flags = main.rebalance_flags(index, rebalance)
+    shares, level = None, base
+    for t in range(len(prices)):
+        if shares is None:
+            if np.isnan(prices[t]).any():
+                continue
+            shares = level * weights / prices[t]
+        level = shares @ prices[t]
+        out[t] = level
+        if flags[t] and t:
+            shares = level * weights / prices[t]
+    return out
+
+
+class SyntheticIndexTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.df = make_prices(['A', 'B', 'C'], n_days=500, seed=1)
+        self.weights = [0.35, 0.35, 0.30]
+
+    def test_return_method_matches_loop(self):
+        for rebalance in ('none', 'monthly', 'quarterly'):
+            with self.subTest(rebalance=rebalance):
+                expected = loop_synthetic(self.df.to_numpy(), self.weights, self.df.index, rebalance)
+                actual = main.compute_synthetic(self.df.to_numpy(), self.weights, self.df.index, 'return', rebalance)
+                np.testing.assert_allclose(actual, expected, rtol=1e-10)
+
+    def test_return_method_with_gaps(self):
+        # 成分上市时间不同 (开头缺失) 和中途停牌 (中间缺失, 沿用上一个价格)
+        prices = self.df.to_numpy().copy()
+        prices[:30, 1] = np.nan
+        prices[200:205, 2] = np.nan
+        expected = loop_synthetic(prices, self.weights, self.df.index, 'quarterly')
+        actual = main.compute_synthetic(prices, self.weights, self.df.index, 'return', 'quarterly')
+        self.assertTrue(np.isnan(actual[:30]).all())
+        self.assertEqual(actual[30], 100.0)
+        np.testing.assert_allclose(actual, expected, rtol=1e-10)
+
+    def test_price_method_is_weighted_sum(self):
+        actual = main.compute_synthetic(self.df.to_numpy(), self.weights, self.df.index, 'price')
+        np.testing.assert_allclose(actual, self.df.to_numpy() @ np.array(self.weights))
+
+    def test_nested_synthetics(self):
+        config = {
+            'INNER': {'components': {'A': 0.5, 'B': 0.5}, 'method': 'return', 'rebalance': 'monthly'},
+            'OUTER': {'components': {'INNER': 0.6, 'C': 0.4}, 'method': 'return', 'rebalance': 'quarterly'},
+        }
+        out = main.synthesize_indices(self.df, config)
+        inner = loop_synthetic(self.df[['A', 'B']].to_numpy(), [0.5, 0.5], self.df.index, 'monthly')
+        outer = loop_synthetic(np.column_stack([inner, self.df['C']]), [0.6, 0.4], self.df.index, 'quarterly')
+        np.testing.assert_allclose(out['INNER'], inner, rtol=1e-10)
+        np.testing.assert_allclose(out['OUTER'], outer, rtol=1e-10)
+
+    def test_circular_reference_raises(self):
+        config = {'X': {'components': {'Y': 1.0}}, 'Y': {'components': {'X': 1.0}}}
+        with self.assertRaises(ValueError):
+            main.synthetic_order(config)
+
+
+if __name__ == "__main__":
+    unittest.main()
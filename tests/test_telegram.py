@@ -0,0 +1,109 @@
+"""Telegram 推送: 对本地 aiohttp 模拟服务发送, 检查 429 / 5xx 重试、4xx 放弃和分片顺序"""
+import asyncio
+import threading
+import unittest
+
+from aiohttp import web
+
+from support import OfflineTestCase, main
+
+
+class MockTelegram:
+    """在后台线程的事件循环里运行的模拟 Bot API; responses 为按请求顺序返回的 (状态码, JSON) 列表, 用完后返回 200"""
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.requests = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    async def handle(self, request):
+        body = await request.json()
+        self.requests.append((body['chat_id'], body['text']))
+        if body['chat_id'] == 'bad':
+            return web.json_response({'ok': False, 'description': 'chat not found'}, status=400)
+        if self.responses:
+            status, payload = self.responses.pop(0)
+            return web.json_response(payload, status=status)
+        return web.json_response({'ok': True})
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/bottest-token/sendMessage', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    def __enter__(self):
+        self.thread.start()
+        port = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class TelegramDeliveryTest(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.TG_BOT_TOKEN = 'test-token'
+        main.TELEGRAM_CONFIG.update(per_chat_interval=0.0, max_retries=3, timeout=5)
+        main.RUN_REPORT['counters'].clear()
+
+    def deliver(self, server, text, chat_ids):
+        main.TELEGRAM_CONFIG['api_base'] = server.url
+        return asyncio.run(main.deliver_telegram(text, chat_ids))
+
+    def test_retries_429_and_5xx_then_gives_up_on_4xx(self):
+        responses = [(502, {'ok': False}), (429, {'ok': False, 'parameters': {'retry_after': 0.01}})]
+        with MockTelegram(responses) as server:
+            results = self.deliver(server, "hello", ['c1', 'bad'])
+        self.assertEqual(results, {'c1': True, 'bad': False})
+        # c1: 502 -> 429 -> 200; bad 只请求一次
+        self.assertEqual(sum(1 for chat, _ in server.requests if chat == 'bad'), 1)
+        self.assertEqual(main.RUN_REPORT['counters']['telegram_retries'], 2)
+        self.assertEqual(main.RUN_REPORT['counters']['telegram_requests'], 4)
+
+    def test_retries_exhausted(self):
+        main.TELEGRAM_CONFIG['max_retries'] = 2
+        responses = [(429, {'ok': False, 'parameters': {'retry_after': 0.01}})] * 3
+        with MockTelegram(responses) as server:
+            results = self.deliver(server, "hello", ['c1'])
+        self.assertEqual(results, {'c1': False})
+        self.assertEqual(len(server.requests), 3)
+
+    def test_long_message_is_split_in_order(self):
+        main.TELEGRAM_CONFIG['chunk_size'] = 50
+        lines = [f"line {i:03d} " + "x" * 20 for i in range(20)]
+        with MockTelegram() as server:
+            results = self.deliver(server, "\n".join(lines), ['c1', 'c2'])
+        self.assertEqual(results, {'c1': True, 'c2': True})
+        for chat in ('c1', 'c2'):
+            chunks = [text for c, text in server.requests if c == chat]
+            self.assertTrue(all(len(c) <= 50 for c in chunks))
+            self.assertEqual("\n".join(chunks).split("\n"), lines)
+
+    def test_send_telegram_calls_on_sent_only_when_all_chats_succeed(self):
+        rrg = {'XLK': {'display_name': 'XLK 科技', 'current_x': 101.0, 'current_y': 102.0}}
+        for chats, expected in (('c1,c2', True), ('c1,bad', False)):
+            with self.subTest(chats=chats), MockTelegram() as server:
+                main.TELEGRAM_CONFIG['api_base'] = server.url
+                main.TG_CHAT_ID = chats
+                sent = []
+                main.send_telegram(rrg, [], on_sent=lambda: sent.append(True)).join(timeout=30)
+                self.assertEqual(bool(sent), expected)
+
+    def test_not_configured(self):
+        main.TG_BOT_TOKEN = None
+        self.assertIsNone(main.send_telegram({}, []))
+
+
+if __name__ == "__main__":
+    unittest.main()